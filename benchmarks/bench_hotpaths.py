@@ -0,0 +1,330 @@
+"""Microbenchmarks for the NotifyHelper hot paths.
+
+Runs against a minimal fake ``hass`` so no Home Assistant instance is needed,
+only the ``homeassistant`` and ``jinja2`` packages of a development install.
+
+    python benchmarks/bench_hotpaths.py --output before.json
+    python benchmarks/bench_hotpaths.py --compare before.json
+
+Every result is one JSON object with ops/sec, retained bytes and blocks per
+op and peak traced memory (measured in a separate pass so tracing does not
+skew timing) and, for the dispatch cases, the size of the serialized payload.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jinja2 import Environment, DictLoader  # noqa: E402
+
+from custom_components.notifyhelper.const import TEMPLATE_FILE  # noqa: E402
+from custom_components.notifyhelper.data import NotificationData, Retention  # noqa: E402
+from custom_components.notifyhelper.helper import (  # noqa: E402
+    NotificationHelper, PreparedNotification,
+)
+from custom_components.notifyhelper.search import SearchIndex  # noqa: E402
+from custom_components.notifyhelper.websocket import SharedEvent  # noqa: E402
+
+SIZES = (50, 500, 5000, 50000)
+SUBSCRIBERS = 10
+ROOMS = ("garage", "front", "kitchen", "garden", "office", "bedroom", "hallway")
+QUERIES = {"term": "kitchen", "prefix": "gar*", "phrase": '"garage door"', "cjk": "車庫"}
+
+TEMPLATES = {
+    "minimal": "<strong>{{ title }}</strong> {{ message }}",
+    "default": None,  # 由 template.html 載入
+    "heavy": """
+{%- for line in message.split('\\n') -%}
+<p>{{ loop.index }}. {{ line | title }}</p>
+{%- endfor -%}
+{%- for word in title.split() | sort -%}<span>{{ word | upper }}</span>{%- endfor -%}
+{%- if image %}<img src="{{ image }}?{{ timestamp }}">{% endif -%}
+<b>{{ send_time }}</b> {{ message | wordcount }} words
+""",
+}
+
+CALL_DATA = {
+    "title": "Front door",
+    "message": "Motion detected\\nCamera 2 recorded a clip",
+    "color": "red",
+    "data": {
+        "image": "/local/snapshots/front.jpg",
+        "push": {"sound": "default"},
+        "actions": [{"action": f"ACTION_{i}", "title": f"Action {i}"} for i in range(4)],
+    },
+}
+
+
+class FakeHass:
+    """just enough of hass for a helper that is never started"""
+
+    def __init__(self):
+        self.data = {}
+        self.config = SimpleNamespace(
+            config_dir=ROOT, path=lambda *parts: os.path.join(ROOT, *parts)
+        )
+        self.services = SimpleNamespace(async_call=self._async_call)
+
+    async def _async_call(self, *args, **kwargs):
+        return None
+
+    async def async_add_executor_job(self, target, *args):
+        return target(*args)
+
+
+class FakeStore:
+    has_log = False
+
+
+class FakeDelivery:
+    def async_deliver(self, *args, **kwargs):
+        pass
+
+
+class FakeMedia:
+    evictions = 0
+
+    async def async_resolve(self, prepared):
+        return prepared.image, prepared.video
+
+    def url(self, cached, source):
+        return cached or source
+
+    def thumbnail(self, url):
+        return None
+
+
+def load_templates() -> dict:
+    with open(os.path.join(ROOT, "custom_components", "notifyhelper", TEMPLATE_FILE), encoding="utf-8") as file:
+        sources = {name: source or file.read() for name, source in TEMPLATES.items()}
+    env = Environment(
+        loader=DictLoader(sources), autoescape=True, trim_blocks=True, lstrip_blocks=True
+    )
+    return {name: env.get_template(name) for name in sources}
+
+
+def filled_data(size: int) -> NotificationData:
+    data = NotificationData(maxlen=size)
+    timestamp = time.time()
+    for i in range(size):
+        data.add_message(0, f"Title {i}", f"Message body {i}", timestamp + i, "red")
+    data.drain_journal()
+    return data
+
+
+def make_helper(size: int, template) -> NotificationHelper:
+    helper = NotificationHelper(
+        FakeHass(), "bench", "person.bench", ["mobile_app_a"], ["mobile_app_b"],
+        "/lovelace/notify", FakeStore(), Retention(max_count=size),
+    )
+    helper._notifidata = filled_data(size)
+    helper._template = template
+    helper._delivery = FakeDelivery()
+    helper._media = FakeMedia()
+    return helper
+
+
+def measure(func, min_time: float) -> dict:
+    """time func until min_time has passed, then trace allocations of a shorter run"""
+    func()
+    ops = 0
+    started = time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < min_time:
+        func()
+        ops += 1
+
+    traced = max(1, min(ops, 200))
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(traced):
+        func()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+
+    return {
+        "ops": ops,
+        "ops_per_sec": round(ops / elapsed, 1),
+        "retained_bytes_per_op": round(sum(d.size_diff for d in diff) / traced, 1),
+        "retained_blocks_per_op": round(sum(d.count_diff for d in diff) / traced, 2),
+        "peak_bytes": peak,
+    }
+
+
+def bench_data(size: int, min_time: float):
+    data = filled_data(size)
+    counter = iter(range(10**12))
+
+    def add_message():
+        i = next(counter)
+        data.add_message(i, "Title", "Message body", time.time(), "red")
+        data.drain_journal()
+
+    def read_messages():
+        data.read_messages()
+        data.drain_journal()
+
+    def page():
+        data.page(data.next_id - size // 2, 50)
+
+    yield "data.add_message", {}, measure(add_message, min_time)
+    yield "data.read_messages", {}, measure(read_messages, min_time)
+    yield "data.page", {}, measure(page, min_time)
+    yield "data.to_dict", {}, measure(data.to_dict, min_time)
+
+
+def bench_search(size: int, min_time: float):
+    data = NotificationData(maxlen=size, index=SearchIndex())
+    timestamp = time.time()
+    for i in range(size):
+        room = ROOMS[i % len(ROOMS)]
+        # 片語的各個詞也會分開出現，不相鄰的文件必須被排除
+        data.add_message(
+            0, f"{room.title()} {'door' if i % 3 else 'window'}",
+            f"Motion in the {room} at {i % 24}h{' by the door' if i % 5 == 0 else ''}, "
+            f"{'車庫' if i % 2 else '車道'}攝影機 {i}，庫存 {i % 10}",
+            timestamp + i,
+        )
+    data.drain_journal()
+
+    for name, query in QUERIES.items():
+        yield f"search.{name}", {}, measure(lambda query=query: data.index.search(query), min_time)
+
+
+def bench_helper(size: int, name: str, template, loop, min_time: float):
+    helper = make_helper(size, template)
+
+    def render():
+        # 每次建立新的通知，避免命中共用的渲染結果
+        prepared = PreparedNotification.from_call(CALL_DATA)
+        loop.run_until_complete(helper._async_render(prepared, 1))
+        helper._notifidata.drain_journal()
+
+    def send():
+        prepared = PreparedNotification.from_call(CALL_DATA)
+        loop.run_until_complete(helper._async_send(prepared))
+        helper._notifidata.drain_journal()
+
+    def snapshot_cached():
+        return json.dumps(helper._snapshot())
+
+    def snapshot_cold():
+        helper._render_cache.clear()
+        return json.dumps(helper._snapshot())
+
+    def fanout():
+        # 一則快照送給多個訂閱者，只編碼一次
+        event = SharedEvent(helper._snapshot())
+        return [event.message(i) for i in range(SUBSCRIBERS)]
+
+    def delta():
+        changes = loop.run_until_complete(
+            helper._async_render(PreparedNotification.from_call(CALL_DATA), 1)
+        )
+        helper._notifidata.drain_journal()
+        return json.dumps(helper._event(changes))
+
+    params = {"template": name}
+    yield "helper._async_render", params, measure(render, min_time)
+    yield "helper._async_send", params, measure(send, min_time)
+    yield "helper.snapshot_fanout", {**params, "subscribers": SUBSCRIBERS}, measure(fanout, min_time)
+    for case, func in (
+        ("helper.snapshot_cached", snapshot_cached),
+        ("helper.snapshot_cold", snapshot_cold),
+        ("helper.delta_event", delta),
+    ):
+        result = measure(func, min_time)
+        result["payload_bytes"] = len(func().encode())
+        yield case, params, result
+
+
+def run(sizes, templates, min_time: float):
+    loop = asyncio.new_event_loop()
+    try:
+        for size in sizes:
+            for case, params, result in bench_data(size, min_time):
+                yield {"case": case, "size": size, **params, **result}
+            for case, params, result in bench_search(size, min_time):
+                yield {"case": case, "size": size, **params, **result}
+            for name, template in templates.items():
+                for case, params, result in bench_helper(size, name, template, loop, min_time):
+                    yield {"case": case, "size": size, **params, **result}
+    finally:
+        loop.close()
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def key(result: dict) -> tuple:
+    return result["case"], result["size"], result.get("template")
+
+
+def compare(results: list[dict], baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = {key(r): r for r in json.load(file)["results"]}
+
+    print(f"{'case':<26}{'size':>7} {'template':<9}{'ops/s':>12}{'change':>9}{'bytes/op':>11}", file=sys.stderr)
+    for result in results:
+        old = baseline.get(key(result))
+        change = (
+            f"{(result['ops_per_sec'] / old['ops_per_sec'] - 1) * 100:+.1f}%"
+            if old and old["ops_per_sec"] else "new"
+        )
+        print(
+            f"{result['case']:<26}{result['size']:>7} {result.get('template', '-'):<9}"
+            f"{result['ops_per_sec']:>12.1f}{change:>9}{result['retained_bytes_per_op']:>11.1f}",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--templates", nargs="+", choices=TEMPLATES, default=list(TEMPLATES))
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per case")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+
+    templates = {name: template for name, template in load_templates().items() if name in args.templates}
+    results = []
+    for result in run(args.sizes, templates, args.min_time):
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,27 +4,37 @@ import asyncio
 import logging
 
 from copy import deepcopy
+from datetime import timedelta
 
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.helpers.service import async_set_service_schema
-from homeassistant.helpers.storage import Store
 from homeassistant.loader import async_get_integration
 
-from .helper import CMD, NotificationHelper
-from .websocket import register_ws
+from .data import Retention
+from .delivery import DeliveryManager
+from .media import MediaCache
+from .helper import CMD, NotificationHelper, PreparedNotification
+from .render import TemplateCache
+from .storage import NotificationStore
+from .websocket import register_ws, register_ws_commands
 from .card import async_setup_frontend, async_del_frontend
 from .const import (
     DOMAIN, CONF_IOS_DEVICES, CONF_ANDROID_DEVICES, 
-    CONF_ENTRY_NAME, CONF_URL, NOTIFY_DOMAIN, 
+    CONF_ENTRY_NAME, CONF_URL, CONF_HISTORY_LOG, CONF_MAX_COUNT, CONF_LOG_MAX_COUNT,
+    CONF_MAX_AGE, CONF_MAX_SIZE, CONF_BACKPRESSURE, BACKPRESSURE_BLOCK, CONF_DEDUP_WINDOW, CONF_DIGEST_INTERVAL, HISTORY_LIMIT, EXPIRE_INTERVAL, NOTIFY_DOMAIN, 
     ALL_PERSON_SCHEMA, NOTIFY_PERSON_SCHEMA, READ_SCHEMA, 
     CLEAR_SCHEMA, ALL_PERSON_DESCRIBE, NOTIFY_PERSON_DESCRIBE,
-    SERVICES_LIST, HELPER, PERSON, HELPER_VER,
+    SERVICES_LIST, HELPER, PERSON, PERSONS, HELPER_VER, TEMPLATE, DELIVERY, MEDIA,
 )
 
 CONFIG_SCHEMA = cv.removed(DOMAIN, raise_if_present=True)  # YAML 配置已棄用
+PLATFORMS: list[Platform] = [Platform.SENSOR]
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -54,6 +64,13 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
         integration = await async_get_integration(hass, DOMAIN)
         integration_ver = str(integration.version) if integration.version else None
         hass.data[DOMAIN][HELPER_VER] = integration_ver
+        hass.data[DOMAIN][TEMPLATE] = TemplateCache(hass)
+        hass.data[DOMAIN][DELIVERY] = DeliveryManager(hass)
+        hass.data[DOMAIN][MEDIA] = MediaCache(hass)
+        await hass.data[DOMAIN][MEDIA].async_setup()
+        # person 實體 id -> helper，發送時直接查表
+        hass.data[DOMAIN][PERSONS] = {}
+        register_ws_commands(hass)
         await async_setup_frontend(hass)
         
         return True
@@ -72,9 +89,21 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         url = entry.data.get(CONF_URL, None)
         entry_id = entry.entry_id
 
-        storage = Store(hass, 1, f"{DOMAIN}/{entry.entry_id}.json")
+        history_log = entry.data.get(CONF_HISTORY_LOG, False)
+        retention = Retention(
+            # 歷史紀錄檔預設不限數量，只有另外設定時才依數量刪除
+            max_count=entry.data.get(CONF_LOG_MAX_COUNT, 0) if history_log
+                      else entry.data.get(CONF_MAX_COUNT, HISTORY_LIMIT),
+            max_age=entry.data.get(CONF_MAX_AGE, 0) * 86400,
+            max_bytes=entry.data.get(CONF_MAX_SIZE, 0) * 1024,
+        )
+
+        storage = NotificationStore(hass, entry_id, history_log, retention)
         helper = NotificationHelper(hass, entry_id, entry_name, ios_devices, 
-                                    android_devices, url, storage)
+                                    android_devices, url, storage, retention,
+                                    entry.data.get(CONF_BACKPRESSURE, BACKPRESSURE_BLOCK),
+                                    entry.data.get(CONF_DEDUP_WINDOW, 0),
+                                    entry.data.get(CONF_DIGEST_INTERVAL, 0) * 60)
         
         entry.async_on_unload(entry.add_update_listener(update_listener))
 
@@ -85,10 +114,17 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             helper.async_handle_commands(),
             name=f"{DOMAIN} {entry_name} command handler",
         )
+        if retention.max_age:
+            # 只檢查最舊的通知，不需要全部掃描
+            entry.async_on_unload(async_track_time_interval(
+                hass, helper.async_expire, timedelta(seconds=EXPIRE_INTERVAL)
+            ))
         hass.data[DOMAIN][entry_id] = {
             HELPER: helper,
             PERSON: entry_name,
         }
+        hass.data[DOMAIN][PERSONS][entry_name] = helper
+        await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
         return True
     except Exception as e:
@@ -107,7 +143,13 @@ async def update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     try:
+        if not await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
+            return False
+
         entry_data = hass.data[DOMAIN].pop(entry.entry_id, None)
+        persons = hass.data[DOMAIN][PERSONS]
+        if persons.get(entry_data[PERSON]) is entry_data[HELPER]:
+            del persons[entry_data[PERSON]]
         await entry_data[HELPER].aclose()
 
         return True
@@ -123,9 +165,8 @@ async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
 
 async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Handle removal of an entry."""
-    helper = hass.data[DOMAIN][entry.entry_id][HELPER]
-    await helper._store.async_remove() 
-    _LOGGER.debug("Removed file: %s.json", entry.entry_id)
+    await NotificationStore(hass, entry.entry_id, True).async_remove()
+    _LOGGER.debug("Removed files: %s.json, %s.journal, %s/", entry.entry_id, entry.entry_id, entry.entry_id)
 
     if DOMAIN in hass.data and not hass.data[DOMAIN]:
         await async_del_frontend(hass)
@@ -156,27 +197,34 @@ async def async_migrate_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     return True
 
 
-async def notify_all(hass, call):
-    """Send notification to all"""
-    if not hass.data.get(DOMAIN):
-        _LOGGER.warning("No entries available for NotifyHelper to send notifications.")
+async def _async_fan_out(helpers, call_data):
+    """Validate and render a notification once, then queue it for every helper"""
+    if not helpers:
         return
-    else:
-        _LOGGER.debug("Input data: %s", call.data)
 
-    tasks = [
-        entry_data[HELPER].async_put((CMD.SEND, deepcopy(call.data)))
-        for entry_data in hass.data[DOMAIN].values()
-        if isinstance(entry_data, dict) and HELPER in entry_data
-    ]
-    await asyncio.gather(*tasks)
-
-
-async def notify(hass, call):
-    """Send notification to entry"""
-    if not hass.data.get(DOMAIN):
-        _LOGGER.warning("No entries available for NotifyHelper to send notifications.")
-        return
+    prepared = PreparedNotification.from_call(call_data)
+    await _async_put_all(helpers, (CMD.SEND, prepared))
+
+
+async def _async_put_all(helpers, cmd_data):
+    """queue a command for every helper, then report the persons that rejected it"""
+    results = await asyncio.gather(
+        *[helper.async_put(cmd_data) for helper in helpers], return_exceptions=True
+    )
+    # 一個人員的佇列已滿不影響其他人員
+    if failed := [
+        helper.entry_name for helper, result in zip(helpers, results)
+        if isinstance(result, Exception)
+    ]:
+        raise HomeAssistantError(f"NotifyHelper could not queue the command for: {', '.join(failed)}")
+
+
+def _resolve_targets(hass, call, action: str) -> list[NotificationHelper]:
+    """look up the helper of every target person"""
+    persons = hass.data.get(DOMAIN, {}).get(PERSONS)
+    if not persons:
+        _LOGGER.warning("No entries available for NotifyHelper to %s notifications.", action)
+        return []
     else:
         _LOGGER.debug("Input data: %s", call.data)
 
@@ -184,91 +232,46 @@ async def notify(hass, call):
     if not targets:
         _LOGGER.debug("Targets: %s", targets)
         _LOGGER.error("Please specify at least one target")
-        return
+        return []
     elif not isinstance(targets, list):
         _LOGGER.debug("Targets: %s", targets)
         _LOGGER.error("Targets must be a list in YAML format.")
-        return
-    else:
-        if len(targets) > 1:
-            tasks = [
-                entry_data[HELPER].async_put((CMD.SEND, deepcopy(call.data)))
-                for entry_data in hass.data[DOMAIN].values()
-                if (
-                    isinstance(entry_data, dict) 
-                    and HELPER in entry_data
-                    and entry_data[PERSON] in targets
-                )
-            ]
-        else:
-            tasks = [
-                entry_data[HELPER].async_put((CMD.SEND, call.data))
-                for entry_data in hass.data[DOMAIN].values()
-                if (
-                    isinstance(entry_data, dict) 
-                    and HELPER in entry_data
-                    and entry_data[PERSON] in targets
-                )
-            ]
+        return []
 
-        await asyncio.gather(*tasks)
+    helpers = []
+    unknown = []
+    for target in dict.fromkeys(targets):
+        if (helper := persons.get(target)) is not None:
+            helpers.append(helper)
+        else:
+            unknown.append(target)
+    if unknown:
+        _LOGGER.warning("No NotifyHelper entry found for targets: %s", ", ".join(map(str, unknown)))
+    return helpers
 
 
-async def notification_read(hass, call):
-    """Read notification to entry"""
-    if not hass.data.get(DOMAIN):
-        _LOGGER.warning("No entries available for NotifyHelper to read notifications.")
+async def notify_all(hass, call):
+    """Send notification to all"""
+    persons = hass.data.get(DOMAIN, {}).get(PERSONS)
+    if not persons:
+        _LOGGER.warning("No entries available for NotifyHelper to send notifications.")
         return
     else:
         _LOGGER.debug("Input data: %s", call.data)
 
-    targets = call.data.get("targets", [])
-    if not targets:
-        _LOGGER.debug("Targets: %s", targets)
-        _LOGGER.error("Please specify at least one target")
-        return
-    elif not isinstance(targets, list):
-        _LOGGER.debug("Targets: %s", targets)
-        _LOGGER.error("Targets must be a list in YAML format.")
-        return
-    else:
-        tasks = [
-            entry_data[HELPER].async_put((CMD.READ, None))
-            for entry_data in hass.data[DOMAIN].values()
-            if (
-                isinstance(entry_data, dict) 
-                and HELPER in entry_data
-                and entry_data[PERSON] in targets
-            )
-        ]
-        await asyncio.gather(*tasks)
+    await _async_fan_out(list(persons.values()), call.data)
+
+
+async def notify(hass, call):
+    """Send notification to entry"""
+    await _async_fan_out(_resolve_targets(hass, call, "send"), call.data)
+
+
+async def notification_read(hass, call):
+    """Read notification to entry"""
+    await _async_put_all(_resolve_targets(hass, call, "read"), (CMD.READ, None))
 
 
 async def notification_clear(hass, call):
     """Clear notification to entry"""
-    if not hass.data.get(DOMAIN):
-        _LOGGER.warning("No entries available for NotifyHelper to clear notifications.")
-        return
-    else:
-        _LOGGER.debug("Input data: %s", call.data)
-
-    targets = call.data.get("targets", [])
-    if not targets:
-        _LOGGER.debug("Targets: %s", targets)
-        _LOGGER.error("Please specify at least one target")
-        return
-    elif not isinstance(targets, list):
-        _LOGGER.debug("Targets: %s", targets)
-        _LOGGER.error("Targets must be a list in YAML format.")
-        return
-    else:
-        tasks = [
-            entry_data[HELPER].async_put((CMD.CLEAR, None))
-            for entry_data in hass.data[DOMAIN].values()
-            if (
-                isinstance(entry_data, dict) 
-                and HELPER in entry_data
-                and entry_data[PERSON] in targets
-            )
-        ]
-        await asyncio.gather(*tasks)
+    await _async_put_all(_resolve_targets(hass, call, "clear"), (CMD.CLEAR, None))
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import asyncio
+
+from collections import deque
+from enum import Enum
+
+from .const import (
+    BACKPRESSURE_BLOCK, BACKPRESSURE_COALESCE, BACKPRESSURE_FAIL_FAST,
+    PRIORITIES, PRIORITY_AGING,
+)
+
+
+class CMD(Enum):
+    SEND = "send"
+    READ = "read"
+    CLEAR = "clear"
+    EXPIRE = "expire"
+    CLOSE = "close"
+
+
+# 內部控制指令不受容量限制，也不會被丟棄
+CONTROL_COMMANDS = (CMD.EXPIRE, CMD.CLOSE)
+
+
+def _same_command(queued: tuple, item: tuple) -> bool:
+    cmd, data = item
+    if queued[0] is not cmd:
+        return False
+    if cmd is not CMD.SEND:
+        return True
+    return queued[1].digest == data.digest
+
+
+class CommandQueue:
+    """bounded command queue with priority lanes and a backpressure policy
+
+    Sends are queued in one lane per priority and served highest first. After
+    PRIORITY_AGING consecutive picks that skipped an older send, the oldest
+    send is served instead so low priorities keep moving. Other commands act
+    as barriers: sends queued before a read or clear are handled before it,
+    sends queued after it wait for it.
+
+    When the queue is full the policy decides what happens:
+
+    block       wait for room, like asyncio.Queue
+    drop_oldest drop the oldest send of the lowest priority to make room,
+                or the new send when every queued send outranks it
+    coalesce    merge the command into an identical queued one, otherwise
+                drop like drop_oldest
+    fail_fast   reject the command with asyncio.QueueFull
+    """
+
+    def __init__(self, maxsize: int, policy: str = BACKPRESSURE_BLOCK, aging: int = PRIORITY_AGING):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.aging = aging
+        self.dropped = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._lanes: dict[str, deque[tuple[int, tuple]]] = {p: deque() for p in PRIORITIES}
+        self._barriers: deque[tuple[int, tuple]] = deque()
+        self._size = 0
+        self._seq = 0
+        self._bypassed = 0
+        self._unfinished = 0
+        self._closed = False
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return not self._size
+
+    def full(self) -> bool:
+        return self._size >= self.maxsize
+
+    def _queue_of(self, item: tuple) -> deque:
+        if item[0] is CMD.SEND:
+            return self._lanes[item[1].priority]
+        return self._barriers
+
+    async def put(self, item: tuple):
+        if self._closed:
+            raise asyncio.QueueShutDown
+
+        if item[0] not in CONTROL_COMMANDS:
+            while self.full():
+                if self.policy == BACKPRESSURE_FAIL_FAST:
+                    self.rejected += 1
+                    raise asyncio.QueueFull
+                if self.policy == BACKPRESSURE_COALESCE and self._coalesce(item):
+                    return
+                if self.policy != BACKPRESSURE_BLOCK:
+                    if self._outranked(item):
+                        # 不為了較低優先等級的通知丟棄重要的通知
+                        self.dropped += 1
+                        return
+                    if self._drop_oldest():
+                        break
+
+                # 佇列中沒有可丟棄的通知時只能等待
+                self._not_full.clear()
+                await self._not_full.wait()
+                if self._closed:
+                    raise asyncio.QueueShutDown
+
+        self._seq += 1
+        self._queue_of(item).append((self._seq, item))
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self._not_empty.set()
+
+    def _coalesce(self, item: tuple) -> bool:
+        """merge item into an identical queued command"""
+        queue = self._queue_of(item)
+        if item[0] is CMD.SEND:
+            merged = any(_same_command(queued, item) for _, queued in queue)
+        else:
+            # 已讀與清除只能併入最後一個指令，否則會改變與通知的先後順序
+            merged = bool(queue) and queue[-1][0] == self._seq and _same_command(queue[-1][1], item)
+        if merged:
+            self.coalesced += 1
+        return merged
+
+    def _outranked(self, item: tuple) -> bool:
+        """whether every queued send has a higher priority than item"""
+        if item[0] is not CMD.SEND:
+            return False
+        rank = PRIORITIES.index(item[1].priority)
+        queued = [i for i, priority in enumerate(PRIORITIES) if self._lanes[priority]]
+        return bool(queued) and max(queued) < rank
+
+    def _drop_oldest(self) -> bool:
+        """drop the oldest queued send of the lowest priority"""
+        for priority in reversed(PRIORITIES):
+            if lane := self._lanes[priority]:
+                lane.popleft()
+                self._size -= 1
+                self.dropped += 1
+                self.task_done()
+                return True
+        return False
+
+    async def get(self) -> tuple:
+        while not self._size:
+            if self._closed:
+                raise asyncio.QueueShutDown
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def get_nowait(self) -> tuple:
+        if not self._size:
+            raise asyncio.QueueEmpty
+        self._size -= 1
+        self._not_full.set()
+        return self._pop()[1]
+
+    def _pop(self) -> tuple[int, tuple]:
+        barrier = self._barriers[0][0] if self._barriers else None
+        heads = [
+            lane for lane in self._lanes.values()
+            if lane and (barrier is None or lane[0][0] < barrier)
+        ]
+        if not heads:
+            return self._barriers.popleft()
+
+        lane = heads[0]
+        oldest = min(heads, key=lambda lane: lane[0][0])
+        if lane is oldest:
+            self._bypassed = 0
+        elif self._bypassed >= self.aging:
+            # 避免低優先等級的通知一直被插隊
+            lane = oldest
+            self._bypassed = 0
+        else:
+            self._bypassed += 1
+        return lane.popleft()
+
+    def task_done(self):
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+    def shutdown(self):
+        """refuse new commands, queued commands are still handed out"""
+        self._closed = True
+        self._not_empty.set()
+        self._not_full.set()
@@ -8,6 +8,9 @@ from homeassistant import config_entries
 from homeassistant.core import callback
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.selector import (
+    SelectSelector,
+    SelectSelectorConfig,
+    SelectSelectorMode,
     TextSelector,
     TextSelectorConfig,
     TextSelectorType,
@@ -19,10 +22,32 @@ from .const import (
     CONF_ANDROID_DEVICES,
     CONF_ENTRY_NAME,
     CONF_URL,
+    CONF_HISTORY_LOG,
+    CONF_MAX_COUNT,
+    CONF_LOG_MAX_COUNT,
+    CONF_MAX_AGE,
+    CONF_MAX_SIZE,
+    CONF_BACKPRESSURE,
+    CONF_DEDUP_WINDOW,
+    CONF_DIGEST_INTERVAL,
+    BACKPRESSURE_BLOCK,
+    BACKPRESSURE_POLICIES,
+    HISTORY_LIMIT,
 )
 
 _LOGGER = logging.getLogger(__name__)
 TEXT_SELECTOR = TextSelector(TextSelectorConfig(type=TextSelectorType.TEXT))
+MAX_COUNT_SCHEMA = vol.All(vol.Coerce(int), vol.Range(min=10, max=1000000))
+LOG_MAX_COUNT_SCHEMA = vol.All(vol.Coerce(int), vol.Range(min=0))  # 0 表示不限制
+MAX_AGE_SCHEMA = vol.All(vol.Coerce(int), vol.Range(min=0, max=3650))  # 天，0 表示不限制
+MAX_SIZE_SCHEMA = vol.All(vol.Coerce(int), vol.Range(min=0))  # KB，0 表示不限制
+DEDUP_WINDOW_SCHEMA = vol.All(vol.Coerce(int), vol.Range(min=0, max=86400))  # 秒，0 表示停用
+DIGEST_INTERVAL_SCHEMA = vol.All(vol.Coerce(int), vol.Range(min=0, max=1440))  # 分鐘，0 表示停用
+BACKPRESSURE_SELECTOR = SelectSelector(SelectSelectorConfig(
+    options=BACKPRESSURE_POLICIES,
+    mode=SelectSelectorMode.DROPDOWN,
+    translation_key=CONF_BACKPRESSURE,
+))
 
 
 class NotifyHelperConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -90,6 +115,22 @@ class NotifyHelperConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 cv.multi_select(mobile_app_devices),
                 vol.Required(CONF_ANDROID_DEVICES, default=[]):
                 cv.multi_select(mobile_app_devices),
+                vol.Optional(CONF_HISTORY_LOG, default=False):
+                bool,
+                vol.Optional(CONF_MAX_COUNT, default=HISTORY_LIMIT):
+                MAX_COUNT_SCHEMA,
+                vol.Optional(CONF_LOG_MAX_COUNT, default=0):
+                LOG_MAX_COUNT_SCHEMA,
+                vol.Optional(CONF_MAX_AGE, default=0):
+                MAX_AGE_SCHEMA,
+                vol.Optional(CONF_MAX_SIZE, default=0):
+                MAX_SIZE_SCHEMA,
+                vol.Optional(CONF_BACKPRESSURE, default=BACKPRESSURE_BLOCK):
+                BACKPRESSURE_SELECTOR,
+                vol.Optional(CONF_DEDUP_WINDOW, default=0):
+                DEDUP_WINDOW_SCHEMA,
+                vol.Optional(CONF_DIGEST_INTERVAL, default=0):
+                DIGEST_INTERVAL_SCHEMA,
             }
         )
 
@@ -142,6 +183,14 @@ class NotifyHelperOptionsFlow(config_entries.OptionsFlow):
 
         old_entry_name = self.config_entry.data.get(CONF_ENTRY_NAME)
         old_url = self.config_entry.data.get(CONF_URL, "")
+        old_history_log = self.config_entry.data.get(CONF_HISTORY_LOG, False)
+        old_max_count = self.config_entry.data.get(CONF_MAX_COUNT, HISTORY_LIMIT)
+        old_log_max_count = self.config_entry.data.get(CONF_LOG_MAX_COUNT, 0)
+        old_max_age = self.config_entry.data.get(CONF_MAX_AGE, 0)
+        old_max_size = self.config_entry.data.get(CONF_MAX_SIZE, 0)
+        old_backpressure = self.config_entry.data.get(CONF_BACKPRESSURE, BACKPRESSURE_BLOCK)
+        old_dedup_window = self.config_entry.data.get(CONF_DEDUP_WINDOW, 0)
+        old_digest_interval = self.config_entry.data.get(CONF_DIGEST_INTERVAL, 0)
         person_entities = self.hass.states.async_entity_ids("person")
 
         notify_services = self.hass.services.async_services().get("notify", {})
@@ -169,6 +218,22 @@ class NotifyHelperOptionsFlow(config_entries.OptionsFlow):
                 cv.multi_select(mobile_app_devices),
                 vol.Required(CONF_ANDROID_DEVICES, default=old_android_devices):
                 cv.multi_select(mobile_app_devices),
+                vol.Optional(CONF_HISTORY_LOG, default=old_history_log):
+                bool,
+                vol.Optional(CONF_MAX_COUNT, default=old_max_count):
+                MAX_COUNT_SCHEMA,
+                vol.Optional(CONF_LOG_MAX_COUNT, default=old_log_max_count):
+                LOG_MAX_COUNT_SCHEMA,
+                vol.Optional(CONF_MAX_AGE, default=old_max_age):
+                MAX_AGE_SCHEMA,
+                vol.Optional(CONF_MAX_SIZE, default=old_max_size):
+                MAX_SIZE_SCHEMA,
+                vol.Optional(CONF_BACKPRESSURE, default=old_backpressure):
+                BACKPRESSURE_SELECTOR,
+                vol.Optional(CONF_DEDUP_WINDOW, default=old_dedup_window):
+                DEDUP_WINDOW_SCHEMA,
+                vol.Optional(CONF_DIGEST_INTERVAL, default=old_digest_interval):
+                DIGEST_INTERVAL_SCHEMA,
             }
         )
 
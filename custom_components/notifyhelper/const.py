@@ -10,6 +10,29 @@ CONF_URL = "url"
 CONF_ENTRY_NAME = "entry_name"
 CONF_IOS_DEVICES = "ios_devices"
 CONF_ANDROID_DEVICES = "android_devices"
+CONF_HISTORY_LOG = "history_log"
+CONF_MAX_COUNT = "max_count"
+CONF_LOG_MAX_COUNT = "log_max_count"
+CONF_MAX_AGE = "max_age"
+CONF_MAX_SIZE = "max_size"
+CONF_BACKPRESSURE = "backpressure"
+CONF_DEDUP_WINDOW = "dedup_window"
+CONF_DIGEST_INTERVAL = "digest_interval"
+
+BACKPRESSURE_BLOCK = "block"
+BACKPRESSURE_DROP_OLDEST = "drop_oldest"
+BACKPRESSURE_COALESCE = "coalesce"
+BACKPRESSURE_FAIL_FAST = "fail_fast"
+BACKPRESSURE_POLICIES = [
+    BACKPRESSURE_BLOCK,
+    BACKPRESSURE_DROP_OLDEST,
+    BACKPRESSURE_COALESCE,
+    BACKPRESSURE_FAIL_FAST,
+]
+
+# 由高到低
+PRIORITIES = ("critical", "high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
 
 SERVICES_LIST = [
     (NOTIFY_DOMAIN, "all_person"),
@@ -18,20 +41,57 @@ SERVICES_LIST = [
     (DOMAIN, "clear"),
 ]
 DATA_PATH = "custom_components/notifyhelper"
+TEMPLATE_FILE = "template.html"
+TEMPLATE_CHECK_INTERVAL = 5
 HELPER_VER = "helper_ver"
+STORAGE_VERSION = 2  # 1：最新在前的 HTML 字串，2：通知紀錄
+SAVE_DELAY = 30
+JOURNAL_MAX_ENTRIES = 200
+HISTORY_LIMIT = 500
+QUEUE_SIZE = 10
+BATCH_MAX_SIZE = 50  # 每次推送與儲存最多合併的指令數
+PRIORITY_AGING = 5
+DEDUP_INDEX_SIZE = 256
+DIGEST_PRIORITY = "low"
+DIGEST_INTERVAL = 900
+DIGEST_MAX_SIZE = 10
+DIGEST_PREVIEW = 5
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE = 200
+FILTER_SCAN_LIMIT = 5000  # 每次篩選最多從歷史紀錄檔讀取的筆數
+SEGMENT_SIZE = 1024 * 1024
+EXPIRE_INTERVAL = 3600
 UPDATE_EVENT = "update"
+EVENT_VERSION = 1
+RENDER_CACHE_SIZE = 100
+DELIVERY_CONCURRENCY = 16
+DELIVERY_TIMEOUT = 10
+DELIVERY_RETRIES = 2
+DELIVERY_BACKOFF = 1.0
+METRICS_WINDOW = 256
+MEDIA_CACHE_BUDGET = 200 * 1024 * 1024
+MEDIA_MAX_FILE = 50 * 1024 * 1024
+MEDIA_THUMB_SIZE = 480
+MEDIA_MEMO_SIZE = 256
 HELPER = "helper"
+TEMPLATE = "template"
+DELIVERY = "delivery"
+MEDIA = "media"
 PERSON = "person"
+PERSONS = "persons"
 
 BASE_URL = "/notify-helper"
 SCRIPT_URL = "/notifications-card.js"
 FRONTEND_URL = BASE_URL + SCRIPT_URL
+MEDIA_URL = BASE_URL + "/media"
 
 ALL_PERSON_SCHEMA = vol.Schema({
     vol.Required("message"): str,
     vol.Optional("title", default=""): str,
     vol.Optional("color", default=""): str,
     vol.Optional("data", default={}): dict,
+    vol.Optional("priority", default=DEFAULT_PRIORITY): vol.In(PRIORITIES),
+    vol.Optional("digest"): bool,
 })
 
 NOTIFY_PERSON_SCHEMA = vol.All(
@@ -41,6 +101,8 @@ NOTIFY_PERSON_SCHEMA = vol.All(
         vol.Optional("title", default=""): str,
         vol.Optional("color", default=""): str,
         vol.Optional("data", default={}): dict,
+        vol.Optional("priority", default=DEFAULT_PRIORITY): vol.In(PRIORITIES),
+        vol.Optional("digest"): bool,
     })
 )
 
@@ -90,6 +152,25 @@ ALL_PERSON_DESCRIBE = {
                 "object": {}
             }
         },
+        "priority": {
+            "description": "Queue priority, higher priorities are handled first",
+            "example": "critical",
+            "default": DEFAULT_PRIORITY,
+            "required": False,
+            "selector": {
+                "select": {
+                    "options": list(PRIORITIES)
+                }
+            }
+        },
+        "digest": {
+            "description": "Record now but push in the next summary instead of right away, defaults to the person setting for low priority",
+            "example": True,
+            "required": False,
+            "selector": {
+                "boolean": {}
+            }
+        },
     },
 }
 
@@ -142,6 +223,25 @@ NOTIFY_PERSON_DESCRIBE = {
                 "object": {}
             }
         },
+        "priority": {
+            "description": "Queue priority, higher priorities are handled first",
+            "example": "critical",
+            "default": DEFAULT_PRIORITY,
+            "required": False,
+            "selector": {
+                "select": {
+                    "options": list(PRIORITIES)
+                }
+            }
+        },
+        "digest": {
+            "description": "Record now but push in the next summary instead of right away, defaults to the person setting for low priority",
+            "example": True,
+            "required": False,
+            "selector": {
+                "boolean": {}
+            }
+        },
     },
 }
 
@@ -1,54 +1,360 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Deque
-from collections import deque
+from typing import Deque, NamedTuple
+from collections import deque, OrderedDict
+from itertools import islice, takewhile
+
+from .search import FilterIndex, SearchIndex, ViewFilter
+
+@dataclass(slots=True)
+class Notification:
+    id: int
+    timestamp: float
+    title: str
+    message: str
+    color: str | None = None
+    image: str | None = None
+    video: str | None = None
+    html: str | None = None  # 舊版本只保存了渲染後的 HTML
+    count: int = 1  # 合併的重複通知數量
+    tag: str | None = None
+    # 媒體快取中的副本，被淘汰後改用原本的 image 與 video
+    cached_image: str | None = None
+    cached_video: str | None = None
+
+    def to_list(self) -> list:
+        row = [
+            self.id, self.timestamp, self.title, self.message,
+            self.color, self.image, self.video, self.html,
+            self.count if self.count > 1 else None, self.tag,
+            self.cached_image, self.cached_video,
+        ]
+        # 省略尾端的預設值以縮小儲存檔案
+        while len(row) > 4 and row[-1] is None:
+            row.pop()
+        return row
+
+    @classmethod
+    def from_list(cls, data: list) -> Notification:
+        notification = cls(*data)
+        notification.count = notification.count or 1
+        return notification
+
+    @property
+    def size(self) -> int:
+        """approximate stored size in bytes"""
+        return 48 + sum(
+            len(value) for value in (
+                self.title, self.message, self.color, self.image, self.video, self.html, self.tag,
+                self.cached_image, self.cached_video,
+            ) if value
+        )
+
+
+class Retention(NamedTuple):
+    max_count: int = 500
+    max_age: float = 0  # 秒，0 表示不限制
+    max_bytes: int = 0  # 0 表示不限制
+
+
+class DedupIndex:
+    """bounded index of recently sent content hashes within a time window"""
+
+    def __init__(self, window: float, maxsize: int = 256):
+        self.window = window
+        self.maxsize = maxsize
+        # 依首次發送時間排序，過期的項目只會出現在前端
+        self._entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+
+    def get(self, digest: str, now: float) -> int | None:
+        """return the id sent for digest within the window"""
+        while self._entries:
+            _, sent = next(iter(self._entries.values()))
+            if now - sent < self.window:
+                break
+            self._entries.popitem(last=False)
+
+        entry = self._entries.get(digest)
+        return entry[0] if entry else None
+
+    def add(self, digest: str, notification_id: int, now: float):
+        self._entries.pop(digest, None)
+        self._entries[digest] = (notification_id, now)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class RenderCache:
+    """bounded LRU cache of rendered HTML keyed by notification id and read state"""
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        self._cache: OrderedDict[tuple[int, bool], str] = OrderedDict()
+
+    def get(self, notification: Notification, read: bool) -> str | None:
+        key = (notification.id, read)
+        if (html := self._cache.get(key)) is not None:
+            self._cache.move_to_end(key)
+        return html
+
+    def put(self, notification: Notification, read: bool, html: str):
+        self._cache[(notification.id, read)] = html
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def discard(self, notification: Notification):
+        self._cache.pop((notification.id, False), None)
+        self._cache.pop((notification.id, True), None)
+
+    def clear(self):
+        self._cache.clear()
+
 
 @dataclass
 class NotificationData:
     maxlen: int = 500
-    messages: Deque[str] = field(init=False)
+    max_age: float = 0
+    max_bytes: int = 0
+    messages: Deque[Notification] = field(init=False)
     badge: int = 0
+    next_id: int = 1
+    read_id: int = 0  # id 小於等於此值的通知皆為已讀
+    index: SearchIndex | None = field(default=None, repr=False)  # 隨通知增減同步更新
+    filters: FilterIndex | None = field(default=None, repr=False)
+    paged: bool = False  # messages 只是歷史紀錄檔中最新的一頁
+    size: int = field(init=False, default=0)
+    journal: list[list] = field(init=False, repr=False)
+    # 歷史紀錄檔只會附加，合併後的數量另外保存
+    counts: dict[int, int] = field(init=False, repr=False)
 
     def __post_init__(self):
-        self.messages = deque(maxlen=self.maxlen)
+        self.messages = deque()
+        self.journal = []
+        self.counts = {}
 
-    def add_message(self, message: str, newbadge: int):
-        self.messages.appendleft(message)
-        self.badge = newbadge
-        return {
-            "msg": list(self.messages),
-            "badge": self.badge,
-        }
+    def _push(self, notification: Notification):
+        self.messages.appendleft(notification)
+        self.size += notification.size
+        self._index(notification)
 
-    def read_messages(self):
-        read = [
-            msg.replace("alert-type='info'", "alert-type='success'")
-            if "alert-type='info'" in msg else msg
-            for msg in self.messages
-        ]
+    def _pop(self) -> Notification:
+        notification = self.messages.pop()
+        self.size -= notification.size
+        if self.index is not None:
+            self.index.remove(notification.id)
+        if self.filters is not None:
+            self.filters.remove(notification)
+        return notification
+
+    def _index(self, notification: Notification):
+        if self.index is not None:
+            self.index.add(notification.id, notification.title, notification.message)
+        if self.filters is not None:
+            self.filters.add(notification)
+
+    def _clear(self):
         self.messages.clear()
-        self.messages.extend(read)
+        self.size = 0
+        if self.index is not None:
+            self.index.clear()
+        if self.filters is not None:
+            self.filters.clear()
+
+    def _reset(self, notifications):
+        """replace messages with notifications ordered newest first"""
+        self._clear()
+        self.messages.extend(islice(notifications, self.maxlen))
+        self.size = sum(n.size for n in self.messages)
+        # 由舊到新加入，索引內的 id 保持遞增
+        for n in reversed(self.messages):
+            self._index(n)
+
+    def evict(self, now: float) -> list[Notification]:
+        """drop the oldest messages beyond the count, size and age limits
+
+        Only the tail is inspected, so each message is checked and removed at
+        most once and the cost per insert stays amortised O(1).
+        """
+        evicted = []
+        cutoff = now - self.max_age if self.max_age else None
+        while self.messages:
+            oldest = self.messages[-1]
+            if (
+                len(self.messages) > self.maxlen
+                or (self.max_bytes and self.size > self.max_bytes and len(self.messages) > 1)
+                # 舊版本轉換的通知沒有時間，只依數量淘汰
+                or (cutoff is not None and 0 < oldest.timestamp < cutoff)
+            ):
+                evicted.append(self._pop())
+            else:
+                break
+        return evicted
+
+    def add_message(
+        self, newbadge: int, title: str, message: str, timestamp: float,
+        color: str | None = None, image: str | None = None, video: str | None = None,
+        tag: str | None = None, cached_image: str | None = None, cached_video: str | None = None,
+    ) -> tuple[Notification, list[Notification]]:
+        """add message and return it with the evicted messages, oldest first"""
+        notification = Notification(
+            self.next_id, timestamp, title, message, color or None, image, video, tag=tag,
+            cached_image=cached_image, cached_video=cached_video,
+        )
+        self.next_id += 1
+        self._push(notification)
+        self.badge = newbadge
+        self.journal.append(["add", notification.to_list(), newbadge])
+        return notification, self.evict(timestamp)
+
+    def expire(self, now: float) -> list[Notification]:
+        """evict messages past the retention age without a new insert"""
+        if evicted := self.evict(now):
+            self.journal.append(["expire", now])
+        return evicted
+
+    def is_read(self, notification: Notification) -> bool:
+        return notification.id <= self.read_id
+
+    def read_messages(self) -> int:
+        """mark every message read by moving the watermark"""
+        self.read_id = self.next_id - 1
         self.badge = 0
-        return {
-            "msg": read,
-            "badge": self.badge,
-        }
+        self.journal.append(["read", self.read_id])
+        return self.read_id
+
+    def find(self, notification_id: int) -> Notification | None:
+        """return the resident message with notification_id"""
+        if not self.messages:
+            return None
+        index = self.messages[0].id - notification_id
+        if 0 <= index < len(self.messages) and self.messages[index].id == notification_id:
+            return self.messages[index]
+        # id 不連續時改為逐一比對
+        return next((n for n in self.messages if n.id == notification_id), None)
+
+    def collapse(self, notification_id: int) -> Notification | None:
+        """count a suppressed duplicate against a resident message"""
+        if (notification := self.find(notification_id)) is None:
+            return None
+        notification.count += 1
+        if self.paged:
+            self.counts[notification.id] = notification.count
+        self.journal.append(["count", notification.id, notification.count])
+        return notification
 
     def clear_messages(self):
-        self.messages.clear()
+        self._clear()
+        self.counts.clear()
         self.badge = 0
-        return {
-            "msg": [],
-            "badge": self.badge,
-        }
-    
+        self.journal.append(["clear"])
+
+    def restore(self, record: list) -> Notification:
+        """build a notification from a history log record with its merged count"""
+        notification = Notification.from_list(record)
+        notification.count = self.counts.get(notification.id, notification.count)
+        return notification
+
+    def forget_counts(self, first_id: int):
+        """drop merged counts of records the history log no longer holds"""
+        for notification_id in [i for i in self.counts if i < first_id]:
+            del self.counts[notification_id]
+
+    def load_page(self, records: list[list]):
+        """replace resident messages with the newest page of the history log"""
+        self._reset(self.restore(r) for r in records)
+        if records:
+            self.next_id = max(self.next_id, records[0][0] + 1)
+
+    def page(self, before: int | None, limit: int) -> list[Notification]:
+        """return up to limit resident messages with id < before, newest first"""
+        if not self.messages:
+            return []
+
+        start = 0 if before is None else max(0, self.messages[0].id - before + 1)
+        page = list(islice(self.messages, start, start + limit))
+        if before is not None and page and page[0].id >= before:
+            # id 不連續時改為逐一比對
+            page = list(islice((n for n in self.messages if n.id < before), limit))
+        return page
+
+    def query(self, view: ViewFilter, before: int | None, limit: int) -> list[Notification]:
+        """return up to limit resident messages matching view with id < before, newest first
+
+        Candidates come from the most selective index and stop at limit, so
+        a narrow view never walks the whole history.
+        """
+        source = self.filters.candidates(view) if self.filters is not None else None
+        # 已讀浮水印之後的 id 數量是未讀數量的上限
+        unread = self.next_id - 1 - self.read_id
+        if view.unread and (source is None or unread < source[0]):
+            source = unread, (n.id for n in takewhile(lambda n: n.id > self.read_id, self.messages))
+        if source is None:
+            source = len(self.messages), (n.id for n in self.messages)
+
+        result = []
+        for notification_id in source[1]:
+            if before is not None and notification_id >= before:
+                continue
+            notification = self.find(notification_id)
+            if notification is not None and view.matches(notification, self.read_id):
+                result.append(notification)
+                if len(result) >= limit:
+                    break
+        return result
+
+    def drain_journal(self) -> list[list]:
+        """return and reset the mutations made since the last drain"""
+        journal, self.journal = self.journal, []
+        return journal
+
+    def apply_journal(self, entries: list[list]):
+        """replay journal entries written after the last snapshot"""
+        for entry in entries:
+            op = entry[0]
+            if op == "add":
+                notification = Notification.from_list(entry[1])
+                if notification.id < self.next_id and self.find(notification.id) is not None:
+                    # 快照已包含此通知
+                    continue
+                self._push(notification)
+                self.evict(notification.timestamp)
+                self.next_id = max(self.next_id, notification.id + 1)
+                self.badge = entry[2]
+            elif op == "read":
+                self.read_id = entry[1]
+                self.badge = 0
+            elif op == "clear":
+                self._clear()
+                self.counts.clear()
+                self.badge = 0
+            elif op == "expire":
+                self.evict(entry[1])
+            elif op == "count":
+                if notification := self.find(entry[1]):
+                    notification.count = entry[2]
+                if self.paged:
+                    self.counts[entry[1]] = entry[2]
+
     def from_dict(self, data: dict):
-        self.messages.extend(data["msg"])
+        # 最新的在前面，超過容量時保留最新的部分，舊格式由 storage 遷移
+        records = data["msg"]
+        self._reset(Notification.from_list(r) for r in records)
+        self.next_id = data.get("next_id", len(records) + 1)
+        self.read_id = data.get("read_id", 0)
+        self.counts = dict(data.get("counts", ()))
         self.badge = data["badge"]
-    
+
     def to_dict(self):
-        return {
-            "msg": list(self.messages),
+        data = {
+            "msg": [n.to_list() for n in self.messages],
             "badge": self.badge,
+            "next_id": self.next_id,
+            "read_id": self.read_id,
         }
+        if self.counts:
+            data["counts"] = list(self.counts.items())
+        return data
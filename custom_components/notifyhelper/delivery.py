@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+
+import voluptuous as vol
+
+from homeassistant.core import callback
+from homeassistant.exceptions import ServiceNotFound, ServiceValidationError
+
+from .const import (
+    DOMAIN, NOTIFY_DOMAIN, DELIVERY_CONCURRENCY, DELIVERY_TIMEOUT,
+    DELIVERY_RETRIES, DELIVERY_BACKOFF,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DeliveryManager:
+    """push notifications to notify services outside the command queue
+
+    A single instance is shared by every entry so the concurrency limit is
+    global. Each device call has its own timeout and is retried with jittered
+    exponential backoff, so one hung device cannot hold up other devices or
+    later notifications.
+    """
+
+    def __init__(
+        self, hass,
+        concurrency: int = DELIVERY_CONCURRENCY,
+        timeout: float = DELIVERY_TIMEOUT,
+        retries: int = DELIVERY_RETRIES,
+        backoff: float = DELIVERY_BACKOFF,
+    ):
+        self.hass = hass
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    @callback
+    def async_deliver(self, owner: str, device_id: str, payload: dict, listener=None):
+        """start delivering payload to a device without waiting for it
+
+        listener is called with the device id, whether it succeeded and the
+        duration of the last attempt in seconds.
+        """
+        task = self.hass.async_create_background_task(
+            self._async_deliver(owner, device_id, payload, listener),
+            name=f"{DOMAIN} {owner} deliver {device_id}",
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _async_deliver(self, owner: str, device_id: str, payload: dict, listener) -> bool:
+        started = 0.0
+        for attempt in range(self._retries + 1):
+            try:
+                async with self._semaphore:
+                    started = time.monotonic()
+                    async with asyncio.timeout(self._timeout):
+                        await self.hass.services.async_call(
+                            NOTIFY_DOMAIN, device_id, payload, blocking=True
+                        )
+                if listener is not None:
+                    listener(device_id, True, time.monotonic() - started)
+                return True
+            except ServiceNotFound:
+                # 裝置設定錯誤，重試也不會成功
+                _LOGGER.error("%s notify service %s not found", owner, device_id)
+                if listener is not None:
+                    listener(device_id, False, 0.0)
+                return False
+            except (vol.Invalid, ServiceValidationError) as e:
+                # 內容不符合服務格式，重試也不會成功
+                _LOGGER.error("%s notify service %s rejected the payload: %s", owner, device_id, e)
+                if listener is not None:
+                    listener(device_id, False, time.monotonic() - started)
+                return False
+            except TimeoutError:
+                error = f"timed out after {self._timeout}s"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+
+            if attempt == self._retries:
+                _LOGGER.error(
+                    "%s failed to deliver to %s after %s attempts: %s",
+                    owner, device_id, attempt + 1, error,
+                )
+                if listener is not None:
+                    listener(device_id, False, time.monotonic() - started)
+                return False
+
+            # 完全抖動的指數退避，避免同時重試
+            delay = random.uniform(0, self._backoff * 2 ** attempt)
+            _LOGGER.debug(
+                "%s delivery to %s %s, retrying in %.1fs", owner, device_id, error, delay
+            )
+            await asyncio.sleep(delay)
+        return False
@@ -1,34 +1,175 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import json
 import logging
-import os
+import time
 
-from enum import Enum
+from dataclasses import dataclass, field
+from functools import partial
 from types import MappingProxyType
-from urllib.parse import urlparse
-from jinja2 import Environment, FileSystemLoader
+from typing import Mapping
 
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
 from homeassistant.core import callback
 from homeassistant.util.dt import now, as_timestamp
 from homeassistant.helpers.dispatcher import async_dispatcher_send
-
-from .data import NotificationData
-from .const import DOMAIN, DATA_PATH, UPDATE_EVENT
+from homeassistant.helpers.event import async_call_later
+
+from .commands import CMD, CommandQueue
+from .data import DedupIndex, Notification, NotificationData, RenderCache, Retention
+from .metrics import HelperMetrics
+from .render import render_template
+from .search import FilterIndex, SearchIndex, ViewFilter
+from .websocket import SharedEvent
+from .const import (
+    DOMAIN, UPDATE_EVENT, EVENT_VERSION, RENDER_CACHE_SIZE, TEMPLATE, DELIVERY,
+    MEDIA, HISTORY_PAGE_SIZE, FILTER_SCAN_LIMIT, QUEUE_SIZE, BATCH_MAX_SIZE, BACKPRESSURE_BLOCK, DEFAULT_PRIORITY, DEDUP_INDEX_SIZE,
+    DIGEST_PRIORITY, DIGEST_INTERVAL, DIGEST_MAX_SIZE, DIGEST_PREVIEW,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
 
-class CMD(Enum):
-    SEND = "send"
-    READ = "read"
-    CLEAR = "clear"
-    CLOSE = "close"
+def _overlay(data: Mapping, badge: int | None, url: str | None) -> dict:
+    """layer badge and url over the shared payload without modifying it
+
+    Only the top level (and push, when a badge is set) is rebuilt; nested
+    blocks such as actions stay shared between every person and device.
+    """
+    layer = dict(data)
+    if url:
+        layer.setdefault("url", url)
+    if badge is not None:
+        layer["push"] = {**(data.get("push") or {}), "badge": badge}
+    return layer
+
+
+@dataclass(frozen=True, slots=True)
+class PreparedNotification:
+    """validated send payload shared by every target helper"""
+    title: str
+    message: str
+    color: str | None
+    data: MappingProxyType
+    image: str | None
+    video: str | None
+    timestamp: float
+    priority: str = DEFAULT_PRIORITY
+    tag: str | None = None
+    digest: str = ""
+    summarize: bool | None = None  # None 表示依人員設定
+    received: float = field(default_factory=time.monotonic, compare=False, repr=False)
+    _rendered: dict = field(default_factory=dict, compare=False, repr=False)
+    _media: dict = field(default_factory=dict, compare=False, repr=False)
+
+    @classmethod
+    def from_call(cls, call_data) -> PreparedNotification:
+        """apply defaults and extract media once per service call"""
+        parameters_data = call_data.get("data") or {}
+
+        if "android" not in parameters_data and "ios" not in parameters_data:
+            image = parameters_data.get("image")
+            video = parameters_data.get("video")
+            tag = parameters_data.get("tag")
+        else:
+            android_data = parameters_data.get("android")
+            ios_data = parameters_data.get("ios")
+            image = (android_data and android_data.get("image")) or \
+                    (ios_data and ios_data.get("image"))
+            video = (android_data and android_data.get("video")) or \
+                    (ios_data and ios_data.get("video"))
+            tag = (android_data and android_data.get("tag")) or \
+                  (ios_data and ios_data.get("tag"))
+
+        title = call_data.get("title") or "Notification"
+        message = call_data.get("message") or "No message"
+        color = call_data.get("color") or None
+        # 內容雜湊，用於辨識重複的通知
+        digest = hashlib.blake2b(
+            json.dumps([title, message, color, parameters_data], sort_keys=True, default=str).encode(),
+            digest_size=8,
+        ).hexdigest()
+
+        return cls(
+            title=title,
+            message=message,
+            color=color,
+            data=MappingProxyType(parameters_data),
+            image=image,
+            video=video,
+            timestamp=as_timestamp(now()),
+            priority=call_data.get("priority") or DEFAULT_PRIORITY,
+            tag=str(tag) if tag else None,
+            digest=digest,
+            summarize=call_data.get("digest"),
+        )
+
+    def render(self, template, image=None, video=None, thumbnail=None) -> str:
+        """render unread HTML once per template and share it
+
+        image and video are the cached media urls, shared by every helper.
+        """
+        if (html := self._rendered.get(template)) is None:
+            html = self._rendered[template] = render_template(
+                template, self.title, self.message, self.color,
+                image or self.image, video or self.video, self.timestamp,
+                thumbnail=thumbnail,
+            )
+        return html
+
+
+def merge_changes(changes: list[dict]) -> list[dict]:
+    """collapse a batch of changes into cleared, added, updated, evicted and read"""
+    cleared = False
+    added = []
+    updated = {}
+    evicted_before = 0
+    evicted_count = 0
+    read = None
+
+    for change in changes:
+        op = change["op"]
+        if op == "cleared":
+            cleared = True
+            added.clear()
+            updated.clear()
+            evicted_before = evicted_count = 0
+            read = None
+        elif op == "added":
+            added.append(change["notifications"])
+        elif op == "updated":
+            updated.update((item["id"], item) for item in change["notifications"])
+        elif op == "evicted":
+            evicted_before = max(evicted_before, change["before"])
+            evicted_count += change["count"]
+        elif op == "read":
+            read = change["until"]
+
+    # 同一批次內新增又被淘汰的通知不需要送出
+    merged = []
+    if cleared:
+        merged.append({"op": "cleared"})
+    if added_items := [
+        updated.pop(item["id"], item) for chunk in reversed(added) for item in chunk
+        if item["id"] >= evicted_before
+    ]:
+        merged.append({"op": "added", "notifications": added_items})
+    if updated_items := [item for item in updated.values() if item["id"] >= evicted_before]:
+        merged.append({"op": "updated", "notifications": updated_items})
+    if evicted_count:
+        merged.append({"op": "evicted", "before": evicted_before, "count": evicted_count})
+    if read is not None:
+        merged.append({"op": "read", "until": read})
+    return merged
 
 
 class NotificationHelper:
 
-    def __init__(self, hass, entry_id, entry_name, ios_devices, android_devices, url, storage):
+    def __init__(self, hass, entry_id, entry_name, ios_devices, android_devices, url, storage,
+                 retention: Retention = Retention(), backpressure: str = BACKPRESSURE_BLOCK,
+                 dedup_window: float = 0, digest_interval: float = 0):
         self.hass = hass
         self.entry_id = entry_id
         self.entry_name = entry_name.split(".")[1]
@@ -36,179 +177,446 @@ class NotificationHelper:
         self._android_devices_id = android_devices
         self._url = url
         self._store = storage
-        self._limit = 500
+        self._retention = retention
+        # 啟用歷史紀錄時只在記憶體中保留最新一頁，保留期限由紀錄檔處理
+        self._limit = HISTORY_PAGE_SIZE if storage.has_log else retention.max_count
         self._notifidata = None
+        self._templates = None
         self._template = None
-        self._queue = asyncio.Queue(maxsize=10)
+        self._delivery = None
+        self._media = None
+        self._render_cache = RenderCache(RENDER_CACHE_SIZE)
+        self._media_evictions = 0
+        self._dedup = DedupIndex(dedup_window, DEDUP_INDEX_SIZE) if dedup_window else None
+        self._queue = CommandQueue(QUEUE_SIZE, backpressure)
+        self._digest_interval = digest_interval
+        self._digest_pending: list[PreparedNotification] = []
+        self._unsub_digest = None
+        self._unsub_digest_stop = None
         self._Initialized = asyncio.Event()
+        self._seq = 0
+        self.metrics = HelperMetrics(ios_devices + android_devices)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def queue(self) -> CommandQueue:
+        return self._queue
 
     async def async_initialize(self):
         """Check if there are old data and build a dataclass"""
         try:
-            env = Environment(
-                loader=FileSystemLoader(os.path.join(self.hass.config.config_dir, DATA_PATH)),
-                autoescape=True,
-                trim_blocks=True,
-                lstrip_blocks=True
-            )
-            self._template = await self.hass.async_add_executor_job(env.get_template, "template.html")
-
-            self._notifidata = NotificationData(maxlen=self._limit)
+            self._templates = self.hass.data[DOMAIN][TEMPLATE]
+            self._delivery = self.hass.data[DOMAIN][DELIVERY]
+            self._media = self.hass.data[DOMAIN][MEDIA]
+            self._template = await self._templates.async_get()
+
+            if self._store.has_log:
+                self._notifidata = NotificationData(
+                    maxlen=self._limit, index=SearchIndex(), filters=FilterIndex(), paged=True
+                )
+            else:
+                self._notifidata = NotificationData(
+                    maxlen=self._limit,
+                    max_age=self._retention.max_age,
+                    max_bytes=self._retention.max_bytes,
+                    index=SearchIndex(),
+                    filters=FilterIndex(),
+                )
 
-            old_data = await self._store.async_load()
+            old_data, journal = await self._store.async_load()
             if old_data:
                 self._notifidata.from_dict(old_data)
-            else:
+            elif not journal:
                 _LOGGER.warning("No old data found for %s", self.entry_name)
 
+            if journal:
+                # 重播上次快照後的紀錄並壓縮成新的快照
+                self._notifidata.apply_journal(journal)
+                await self._store.async_compact(self._notifidata.to_dict)
+
+            if self._store.has_log:
+                await self._async_load_log_page(old_data)
+
+            if self._retention.max_age or self._retention.max_bytes or self._store.has_log:
+                # 啟動後先套用一次保留規則
+                await self.async_expire()
+
             self._Initialized.set() 
 
         except Exception as e:
             _LOGGER.error("Initialization %s data Error: %s", self.entry_name, e)
 
+    async def _async_load_log_page(self, old_data: dict | None):
+        """load the newest page from the history log, seeding it on first use"""
+        page = await self._store.async_read_before(None, self._limit)
+        if not page and old_data and old_data.get("msg"):
+            # 首次啟用歷史紀錄時，寫入原本保存的所有通知
+            existing = NotificationData(maxlen=len(old_data["msg"]))
+            existing.from_dict(old_data)
+            await self._store.async_seed_log([n.to_list() for n in reversed(existing.messages)])
+            page = await self._store.async_read_before(None, self._limit)
+        self._notifidata.load_page(page)
+
+    async def async_get_page(
+        self, before: int | None = None, limit: int = HISTORY_PAGE_SIZE
+    ) -> list[Notification]:
+        """return up to limit notifications older than before, newest first"""
+        page = self._notifidata.page(before, limit)
+        if len(page) < limit and self._store.has_log:
+            older_than = page[-1].id if page else before
+            if older_than is None and self._notifidata.messages:
+                older_than = self._notifidata.messages[-1].id
+            records = await self._store.async_read_before(older_than, limit - len(page))
+            page.extend(self._notifidata.restore(r) for r in records)
+        return page
+
     async def async_handle_commands(self):
-        """handle commands"""
+        """handle commands in batches"""
         try:
             while True:
-                cmd, call_data = await self._queue.get()
-                try:
-                    msg_data = None
-
-                    if cmd == CMD.CLOSE:
-                        self._store.async_save(self._notifidata.to_dict())
-                        break
-                    elif cmd == CMD.SEND:
-                        msg_data = await self._async_send(call_data)
-                    elif cmd == CMD.READ:
-                        msg_data = await self._async_read()
-                    elif cmd == CMD.CLEAR:
-                        msg_data = await self._async_clear()
-                    
-                    if self._queue.empty() and msg_data is not None:
-                        await self._store.async_save(msg_data)
-                except Exception as e:
-                    _LOGGER.error("Failed to handle command %s: %s", cmd, e)
-                finally:
+                # 批次中的其他指令在處理時才逐一取出，合併成一次推送與一次儲存
+                batch = [await self._queue.get()]
+                closing = await self._async_handle_batch(batch)
+                self.metrics.commands.add(len(batch))
+                for _ in batch:
                     self._queue.task_done()
+                if closing:
+                    break
         except asyncio.CancelledError:
             _LOGGER.debug("Command handler for %s closed", self.entry_name)
             raise
 
+    async def _async_handle_batch(self, batch: list[tuple]) -> bool:
+        """apply a batch of commands, return True when the helper is closing
+
+        batch starts with one command. Later commands are taken from the
+        queue one at a time as the previous one finishes, so a higher
+        priority send queued meanwhile is handled next. They are appended
+        to batch so the caller can mark them done.
+        """
+        with self._store.batch():
+            return await self._async_apply_batch(batch)
+
+    async def _async_apply_batch(self, batch: list[tuple]) -> bool:
+        closing = False
+        changes = []
+
+        try:
+            await self._async_refresh_template()
+        except Exception as e:
+            _LOGGER.error("%s failed to load template: %s", self.entry_name, e)
+
+        while True:
+            cmd, call_data = batch[-1]
+            try:
+                result = None
+
+                if cmd == CMD.CLOSE:
+                    closing = True
+                    break
+                elif cmd == CMD.SEND:
+                    result = await self._async_send(call_data)
+                elif cmd == CMD.READ:
+                    result = await self._async_read()
+                elif cmd == CMD.CLEAR:
+                    result = await self._async_clear()
+                elif cmd == CMD.EXPIRE:
+                    result = await self._async_expire()
+
+                if result:
+                    changes.extend(result)
+            except Exception as e:
+                _LOGGER.error("Failed to handle command %s: %s", cmd, e)
+
+            if self._queue.empty() or len(batch) >= BATCH_MAX_SIZE:
+                break
+            batch.append(self._queue.get_nowait())
+
+        if closing:
+            # 關閉後不再處理剩餘的指令
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+        try:
+            if changes:
+                self._async_dispatch(merge_changes(changes))
+
+            journal = self._notifidata.drain_journal()
+            started = time.perf_counter()
+            dropped, first_id = await self._store.async_append(journal, self._notifidata.to_dict)
+            if journal:
+                self.metrics.persist.add(time.perf_counter() - started)
+            if dropped:
+                self._notifidata.forget_counts(first_id)
+                self._async_dispatch([{"op": "evicted", "before": first_id, "count": dropped}])
+            if closing:
+                await self._store.async_close()
+        except Exception as e:
+            _LOGGER.error("%s failed to apply batch of %s commands: %s", self.entry_name, len(batch), e)
+
+        return closing
+
     async def async_put(
-        self, cmd_data: tuple[CMD, MappingProxyType | dict | None]
+        self, cmd_data: tuple[CMD, PreparedNotification | None]
     ):
-        """put command in queue"""
-        await self._queue.put(cmd_data)
+        """put command in queue, applying the backpressure policy when it is full"""
+        try:
+            await self._queue.put(cmd_data)
+        except asyncio.QueueFull:
+            _LOGGER.warning("%s command queue is full, rejected %s", self.entry_name, cmd_data[0])
+            raise
 
     async def aclose(self):
         """close helper"""
         await self._queue.put((CMD.CLOSE, None))
-        await self._queue.shutdown()
+        self._queue.shutdown()
         await self._queue.join()
+        # 關閉前送出尚未發送的摘要
+        self._async_flush_digest()
         _LOGGER.debug("Helper for %s closed", self.entry_name)
 
-    async def _async_send(self, call_data) -> dict:
+    async def _async_refresh_template(self):
+        """pick up the shared template, dropping cached HTML after a reload
+        or after media it points to was evicted"""
+        template = await self._templates.async_get()
+        if template is not self._template:
+            _LOGGER.debug("%s template changed, clearing render cache", self.entry_name)
+            self._template = template
+            self._render_cache.clear()
+        if self._media is not None and self._media.evictions != self._media_evictions:
+            self._media_evictions = self._media.evictions
+            self._render_cache.clear()
+
+    async def _async_send(self, prepared: PreparedNotification) -> list[dict] | None:
         """send notification"""
-        def _create_send_task(devices, p_data):
+        def _deliver(devices, p_data, badge=None):
             if not devices:
-                return []
-
-            if self._url:
-                p_data.setdefault("url", self._url)
+                return
 
             notification_payload = {
                 "message": message,
                 "title": title,
-                "data": p_data,
+                "data": _overlay(p_data, badge, self._url),
             }
 
-            return [
-                self.hass.services.async_call("notify", device_id, notification_payload)
-                for device_id in devices
-            ]
-
+            listener = partial(
+                self.metrics.record_delivery,
+                started=prepared.received, priority=prepared.priority,
+            )
+            for device_id in devices:
+                self._delivery.async_deliver(
+                    self.entry_name, device_id, notification_payload, listener
+                )
 
         try:
-            _data = dict(call_data)
-            title = _data["title"] = _data.get("title") or "Notification"
-            message = _data["message"] = _data.get("message") or "No message"
-            parameters_data = _data["data"] = _data.get("data") or {}
-            color = _data.get("color")
+            title = prepared.title
+            message = prepared.message
+            parameters_data = prepared.data
+
+            _LOGGER.debug("Send data to %s: %s", self.entry_name, prepared)
+            if (changes := self._async_collapse(prepared)) is not None:
+                return changes
 
-            _LOGGER.debug("Send data to %s: %s", self.entry_name, _data)
             badge = self._notifidata.badge + 1
-            tasks = []
+            # 先記錄歷史再推播，裝置回應慢不會阻塞後續通知
+            changes = await self._async_render(prepared, badge)
+
+            if self._wants_digest(prepared):
+                self._async_queue_digest(prepared)
+                return changes
 
             if "android" not in parameters_data and "ios" not in parameters_data:
-                image = parameters_data.get("image")
-                video = parameters_data.get("video")
-                parameters_data.setdefault("push", {}).update({"badge": badge})
-                tasks = _create_send_task(self._ios_devices_id + self._android_devices_id, parameters_data)
+                _deliver(self._ios_devices_id + self._android_devices_id, parameters_data, badge)
             else:
                 android_data = parameters_data.get("android")
                 ios_data = parameters_data.get("ios")
-                image = (android_data and android_data.get("image")) or \
-                        (ios_data and ios_data.get("image"))
-                video = (android_data and android_data.get("video")) or \
-                        (ios_data and ios_data.get("video"))
 
                 if android_data:
-                    android_tasks = _create_send_task(self._android_devices_id, android_data)
-                    tasks.extend(android_tasks)
+                    _deliver(self._android_devices_id, android_data)
 
                 if ios_data:
-                    ios_data.setdefault("push", {}).update({"badge": badge})
-                    ios_tasks = _create_send_task(self._ios_devices_id, ios_data)
-                    tasks.extend(ios_tasks)
+                    _deliver(self._ios_devices_id, ios_data, badge)
 
-            await asyncio.gather(*tasks)
-            data = await self._async_render(title, message, color, badge, image, video)
-            return data
+            return changes
         except KeyError as e:
             _LOGGER.error("%s get call_data error: %s", self.entry_name, e)
         except Exception as e:
             _LOGGER.error("%s failed to send: %s", self.entry_name, e)
 
-    async def _async_render(
-            self, title, msg, color, badge, image, video
-        ) -> dict:
-        """render template"""
-        def _check_url(url):
-            valid_extensions = {"mp4", "avi", "mov", "png", "jpg", "jpeg", "gif", "webp"}
-            result = urlparse(url)
-            url_bool = result.scheme in ['http', 'https']
-            path = result.path
-            file_type = path.split('.')[-1].lower() \
-                        if '.' in path and path.split('.')[-1].lower() in valid_extensions else None
-            return file_type, url_bool
+    def _wants_digest(self, prepared: PreparedNotification) -> bool:
+        if prepared.summarize is not None:
+            return prepared.summarize
+        return bool(self._digest_interval) and prepared.priority == DIGEST_PRIORITY
 
+    @callback
+    def _async_queue_digest(self, prepared: PreparedNotification):
+        """hold the push back for the next digest"""
+        self._digest_pending.append(prepared)
+        if len(self._digest_pending) >= DIGEST_MAX_SIZE:
+            self._async_flush_digest()
+            return
+        if self._unsub_digest is None:
+            self._unsub_digest = async_call_later(
+                self.hass, self._digest_interval or DIGEST_INTERVAL, self._async_digest_timer
+            )
+        if self._unsub_digest_stop is None:
+            # 停止時不會卸載設定項目，摘要只保存在記憶體中，必須在此送出
+            self._unsub_digest_stop = self.hass.bus.async_listen_once(
+                EVENT_HOMEASSISTANT_STOP, self._async_digest_stop
+            )
 
+    @callback
+    def _async_digest_timer(self, _now):
+        self._unsub_digest = None
+        self._async_flush_digest()
+
+    @callback
+    def _async_digest_stop(self, _event):
+        self._unsub_digest_stop = None
+        self._async_flush_digest()
+
+    @callback
+    def _async_flush_digest(self):
+        """push one summary of the held back notifications to every device"""
+        if self._unsub_digest is not None:
+            self._unsub_digest()
+            self._unsub_digest = None
+        if self._unsub_digest_stop is not None:
+            self._unsub_digest_stop()
+            self._unsub_digest_stop = None
+        if not self._digest_pending:
+            return
+
+        pending, self._digest_pending = self._digest_pending, []
+        lines = [f"{p.title}: {p.message}" for p in reversed(pending[-DIGEST_PREVIEW:])]
+        if len(pending) > DIGEST_PREVIEW:
+            lines.append(f"…and {len(pending) - DIGEST_PREVIEW} more")
+
+        _LOGGER.debug("%s sending digest of %s notifications", self.entry_name, len(pending))
+        badge = self._notifidata.badge if self._notifidata else None
+        devices = self._ios_devices_id + self._android_devices_id
+        payload = {
+            "message": "\n".join(lines),
+            "title": f"{len(pending)} new notifications",
+            "data": _overlay({}, badge, self._url),
+        }
+        for device_id in devices:
+            self._delivery.async_deliver(
+                self.entry_name, device_id, payload, self.metrics.record_delivery
+            )
+
+    async def _async_render(
+            self, prepared: PreparedNotification, badge: int
+        ) -> list[dict] | None:
+        """record notification and render it for subscribers"""
         try:
-            timestamp = as_timestamp(now())
-            send_time = now().strftime("%Y-%m-%d %H:%M:%S")
-
-            video_type, video_is_url = _check_url(video) if video else (None, False)
-            _, image_is_url = _check_url(image) if image else (None, False)
-
-            rendered_html = self._template.render(
-                title=title,
-                message=msg,
-                color=color,
-                image=image,
-                image_is_url=image_is_url,
-                video=video,
-                video_is_url=video_is_url,
-                video_type=video_type,
-                timestamp=timestamp,
-                send_time=send_time
+            # 本機媒體先複製到快取，同一則廣播只處理一次
+            image, video = await self._media.async_resolve(prepared)
+            thumbnail = self._media.thumbnail(image)
+
+            started = time.perf_counter()
+            # 保留原本的來源，快取副本被淘汰後仍可顯示
+            notification, evicted = self._notifidata.add_message(
+                badge, prepared.title, prepared.message, prepared.timestamp,
+                prepared.color, prepared.image, prepared.video, prepared.tag,
+                image if image != prepared.image else None,
+                video if video != prepared.video else None,
             )
-            data = self._notifidata.add_message(rendered_html, badge)
-            await self.async_trigger(data["msg"])
-            return data
+            # 同一則廣播只渲染一次，其他人員共用結果
+            self._render_cache.put(
+                notification, False, prepared.render(self._template, image, video, thumbnail)
+            )
+            self.metrics.render.add(time.perf_counter() - started)
+            if self._dedup is not None:
+                self._dedup.add(prepared.digest, notification.id, prepared.timestamp)
+
+            changes = [{"op": "added", "notifications": [self._item(notification)]}]
+            if evicted := self._async_evicted(evicted):
+                changes.extend(evicted)
+
+            return changes
         except Exception as e:
             _LOGGER.error("%s failed to render template: %s", self.entry_name, e)
 
-    async def _async_read(self) -> dict | None:
+    def _async_collapse(self, prepared: PreparedNotification) -> list[dict] | None:
+        """fold a duplicate sent within the throttle window into the earlier entry"""
+        if self._dedup is None:
+            return None
+
+        notification_id = self._dedup.get(prepared.digest, prepared.timestamp)
+        if notification_id is None or \
+           (notification := self._notifidata.collapse(notification_id)) is None:
+            return None
+
+        _LOGGER.debug("%s suppressed duplicate of %s (x%s)", self.entry_name, notification.id, notification.count)
+        self.metrics.suppressed += 1
+        self._render_cache.discard(notification)
+        return [{"op": "updated", "notifications": [self._item(notification)]}]
+
+    def _render_html(self, notification: Notification) -> str:
+        """render notification on demand, reusing the cached HTML"""
+        read = self._notifidata.is_read(notification)
+        if (html := self._render_cache.get(notification, read)) is not None:
+            return html
+
+        if notification.html is not None:
+            html = notification.html
+            if read:
+                html = html.replace("alert-type='info'", "alert-type='success'")
+        else:
+            image, video = notification.image, notification.video
+            if self._media is not None:
+                image = self._media.url(notification.cached_image, image)
+                video = self._media.url(notification.cached_video, video)
+            html = render_template(
+                self._template, notification.title, notification.message,
+                notification.color, image, video,
+                notification.timestamp, read, notification.count,
+                self._media.thumbnail(image) if self._media else None,
+            )
+
+        self._render_cache.put(notification, read, html)
+        return html
+
+    def _item(self, notification: Notification) -> dict:
+        """build wire item of a notification"""
+        return {"id": notification.id, "html": self._render_html(notification)}
+
+    def _async_evicted(self, evicted: list[Notification]) -> list[dict]:
+        """drop cached HTML of evicted messages and build the change to report"""
+        for old in evicted:
+            self._render_cache.discard(old)
+
+        if not evicted or self._store.has_log:
+            # 歷史紀錄模式下只是移出記憶體，仍可從紀錄檔讀取
+            return []
+        return [{"op": "evicted", "before": evicted[-1].id + 1, "count": len(evicted)}]
+
+    async def _async_expire(self) -> list[dict] | None:
+        """expire messages older than the retention age"""
+        try:
+            if self._store.has_log:
+                dropped, first_id = await self._store.async_apply_retention()
+                if dropped:
+                    self._notifidata.forget_counts(first_id)
+                    return [{"op": "evicted", "before": first_id, "count": dropped}]
+                return None
+
+            return self._async_evicted(self._notifidata.expire(as_timestamp(now()))) or None
+        except Exception as e:
+            _LOGGER.error("%s failed to expire: %s", self.entry_name, e)
+
+    async def async_expire(self, _now=None):
+        """queue a retention check"""
+        try:
+            await self._queue.put((CMD.EXPIRE, None))
+        except asyncio.QueueShutDown:
+            _LOGGER.debug("Helper for %s already closed", self.entry_name)
+
+    async def _async_read(self) -> list[dict] | None:
         """change to read status"""
         try:
             if not self._notifidata.messages:
@@ -217,25 +625,16 @@ class NotificationHelper:
                 )
                 return None
 
-            data = self._notifidata.read_messages()
-            tasks = [
-                self.async_trigger(data["msg"]),
-            ]
+            changes = [{"op": "read", "until": self._notifidata.read_messages()}]
 
-            if self._ios_devices_id:
-                tasks.extend([
-                    self.hass.services.async_call("notify", device_id, {"message": "clear_badge"})
-                    for device_id in self._ios_devices_id
-                ])
-                
-            await asyncio.gather(*tasks)
+            self._async_clear_badge()
 
             _LOGGER.debug("Read successfully")
-            return data
+            return changes
         except Exception as e:
             _LOGGER.error("%s failed to read: %s", self.entry_name, e)
 
-    async def _async_clear(self) -> dict | None:
+    async def _async_clear(self) -> list[dict] | None:
         """clear notifications"""
         try:
             if not self._notifidata.messages:
@@ -244,43 +643,169 @@ class NotificationHelper:
                 )
                 return None
 
-            data = self._notifidata.clear_messages()
-            tasks = [
-                self.async_trigger(data["msg"]),
-            ]
-
-            if self._ios_devices_id:
-                tasks.extend([
-                    self.hass.services.async_call("notify", device_id, {"message": "clear_badge"})
-                    for device_id in self._ios_devices_id
-                ])
+            self._notifidata.clear_messages()
+            self._render_cache.clear()
+            if self._dedup is not None:
+                self._dedup.clear()
+            changes = [{"op": "cleared"}]
 
-            await asyncio.gather(*tasks)
+            self._async_clear_badge()
 
             _LOGGER.debug("Clear successfully")
-            return data
+            return changes
         except Exception as e:
             _LOGGER.error("%s failed to clear: %s", self.entry_name, e)
 
     @callback
-    async def async_trigger(self, msg=None):
-        """trigger notifications update event"""
+    def _async_clear_badge(self):
+        """reset the app badge on every iOS device"""
+        for device_id in self._ios_devices_id:
+            self._delivery.async_deliver(
+                self.entry_name, device_id, {"message": "clear_badge"},
+                self.metrics.record_delivery,
+            )
+
+    def _event(self, changes: list[dict]) -> dict:
+        """build versioned update event"""
+        return {
+            "event_type": UPDATE_EVENT,
+            "person": str(self.entry_name),
+            "version": EVENT_VERSION,
+            "seq": self._seq,
+            "changes": changes,
+        }
+
+    def _page(self, page: list[Notification], limit: int) -> dict:
+        """render a page of notifications with the cursor of the next page"""
+        return {
+            "notifications": [self._item(n) for n in page],
+            "next": page[-1].id if page and len(page) == limit else None,
+        }
+
+    def _snapshot(self, view: ViewFilter | None = None) -> dict:
+        """build first-page snapshot event at the current sequence number"""
+        if view is None:
+            page = self._page(self._notifidata.page(None, HISTORY_PAGE_SIZE), HISTORY_PAGE_SIZE)
+        else:
+            page = self._view_page(view)
+        return self._event([{"op": "snapshot", **page}])
+
+    def _view_page(self, view: ViewFilter) -> dict:
+        """render the first page of view from the resident messages"""
+        page = self._page(self._notifidata.query(view, None, HISTORY_PAGE_SIZE), HISTORY_PAGE_SIZE)
+        if page["next"] is None and self._store.has_log and self._notifidata.messages:
+            # 其餘符合的通知可能在歷史紀錄檔中，由下一頁繼續查詢
+            page["next"] = self._notifidata.messages[-1].id
+        return page
+
+    async def _async_query(self, view: ViewFilter, before: int | None, limit: int) -> dict:
+        """return one page of view, continuing into the history log
+
+        At most FILTER_SCAN_LIMIT log records are read per page. When they
+        run out before the page is full, next points at the last record
+        read so the client can keep loading.
+        """
+        page = self._notifidata.query(view, before, limit)
+        if len(page) >= limit or not self._store.has_log:
+            return self._page(page, limit)
+
+        older_than = before
+        if self._notifidata.messages:
+            oldest = self._notifidata.messages[-1].id
+            older_than = oldest if before is None else min(before, oldest)
+
+        scanned = 0
+        while scanned < FILTER_SCAN_LIMIT:
+            records = await self._store.async_read_before(older_than, HISTORY_PAGE_SIZE)
+            if not records:
+                return self._page(page, limit)
+            for record in records:
+                older_than = record[0]
+                scanned += 1
+                notification = self._notifidata.restore(record)
+                if view.matches(notification, self._notifidata.read_id):
+                    page.append(notification)
+                    if len(page) >= limit:
+                        return self._page(page, limit)
+        return {**self._page(page, limit), "next": older_than}
+
+    @callback
+    def filter_changes(self, changes: list[dict], view: ViewFilter) -> list[dict]:
+        """narrow dispatched changes to the notifications matching view"""
+        filtered = []
+        for change in changes:
+            op = change["op"]
+            if op in ("added", "updated"):
+                items = [
+                    item for item in change["notifications"]
+                    if (n := self._notifidata.find(item["id"])) is not None
+                    and view.matches(n, self._notifidata.read_id)
+                ]
+                if items:
+                    filtered.append({"op": op, "notifications": items})
+            elif op == "read" and view.by_read_state:
+                # 已讀狀態改變時通知會進出檢視，改送新的快照
+                filtered.append({"op": "snapshot", **self._view_page(view)})
+            else:
+                filtered.append(change)
+        return filtered
+
+    @callback
+    def _async_dispatch(self, changes: list[dict]):
+        """send delta changes to subscribers"""
+        self._seq += 1
+        # 所有訂閱者共用同一份編碼後的訊息
+        async_dispatcher_send(
+            self.hass, f"{UPDATE_EVENT}_{self.entry_name}", SharedEvent(self._event(changes))
+        )
+        _LOGGER.debug("%s dispatched seq %s: %s", self.entry_name, self._seq, changes)
+
+    async def async_history(
+        self, before: int | None = None, limit: int = HISTORY_PAGE_SIZE,
+        view: ViewFilter | None = None,
+    ) -> dict | None:
+        """return one page of history older than before, narrowed to view"""
         try:
             if not self._Initialized.is_set():
                 _LOGGER.debug("Waiting for initialization to complete...")
                 await asyncio.wait_for(self._Initialized.wait(), timeout=15)
-            
-            async_dispatcher_send(
-                self.hass, 
-                f"{UPDATE_EVENT}_{self.entry_name}",
-                {
-                    "event_type": UPDATE_EVENT,
-                    "person": str(self.entry_name),
-                    "notifications": msg if msg is not None else list(self._notifidata.messages),
-                }
-            )
-            _LOGGER.debug("%s Notification updated successfully: %s", self.entry_name, msg)
+
+            await self._async_refresh_template()
+            if view is not None:
+                return await self._async_query(view, before, limit)
+            return self._page(await self.async_get_page(before, limit), limit)
+        except asyncio.TimeoutError:
+            _LOGGER.error("%s Initialization timeout", self.entry_name)
+        except Exception as e:
+            _LOGGER.error("%s failed to read history: %s", self.entry_name, e)
+
+    async def async_search(
+        self, query: str, before: int | None = None, limit: int = HISTORY_PAGE_SIZE
+    ) -> dict | None:
+        """return one page of notifications matching query, newest first"""
+        try:
+            if not self._Initialized.is_set():
+                _LOGGER.debug("Waiting for initialization to complete...")
+                await asyncio.wait_for(self._Initialized.wait(), timeout=15)
+
+            await self._async_refresh_template()
+            ids = self._notifidata.index.search(query, before, limit)
+            return self._page([self._notifidata.find(i) for i in ids], limit)
+        except asyncio.TimeoutError:
+            _LOGGER.error("%s Initialization timeout", self.entry_name)
+        except Exception as e:
+            _LOGGER.error("%s failed to search: %s", self.entry_name, e)
+
+    async def async_snapshot(self, view: ViewFilter | None = None) -> dict | None:
+        """return the first-page snapshot for a new or resyncing client"""
+        try:
+            if not self._Initialized.is_set():
+                _LOGGER.debug("Waiting for initialization to complete...")
+                await asyncio.wait_for(self._Initialized.wait(), timeout=15)
+
+            await self._async_refresh_template()
+            return self._snapshot(view)
         except asyncio.TimeoutError:
             _LOGGER.error("%s Initialization timeout", self.entry_name)
         except Exception as e:
-            _LOGGER.error("%s failed to trigger: %s", self.entry_name, e)
+            _LOGGER.error("%s failed to build snapshot: %s", self.entry_name, e)
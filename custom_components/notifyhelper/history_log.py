@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import threading
+
+from array import array
+from bisect import bisect_right
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _Segment:
+    """one log file holding records with consecutive ids, plus its offset index"""
+
+    __slots__ = ("base_id", "log_path", "idx_path", "offsets", "size", "_mm")
+
+    def __init__(self, directory: str, base_id: int):
+        self.base_id = base_id
+        self.log_path = os.path.join(directory, f"{base_id:012d}.log")
+        self.idx_path = os.path.join(directory, f"{base_id:012d}.idx")
+        self.offsets = array("Q")
+        self.size = 0
+        self._mm = None
+
+    @property
+    def count(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def last_id(self) -> int:
+        return self.base_id + len(self.offsets) - 1
+
+    def load(self):
+        """load the offset index, rebuilding it when it does not match the log"""
+        self.size = os.path.getsize(self.log_path)
+        if os.path.exists(self.idx_path):
+            with open(self.idx_path, "rb") as file:
+                raw = file.read()
+            self.offsets.frombytes(raw[:len(raw) - len(raw) % self.offsets.itemsize])
+
+        if self.offsets and self.offsets[-1] < self.size:
+            with open(self.log_path, "rb") as file:
+                file.seek(self.offsets[-1])
+                tail = file.read()
+            if tail.count(b"\n") == 1 and tail.endswith(b"\n"):
+                return
+
+        self._rebuild()
+
+    def _rebuild(self):
+        """scan the log for complete lines and rewrite the index"""
+        _LOGGER.warning("Rebuilding history index %s", self.idx_path)
+        self.offsets = array("Q")
+        position = 0
+        with open(self.log_path, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break  # 寫入途中斷電留下的殘缺行
+                self.offsets.append(position)
+                position += len(line)
+
+        if position != self.size:
+            with open(self.log_path, "r+b") as file:
+                file.truncate(position)
+            self.size = position
+
+        with open(self.idx_path, "wb") as file:
+            self.offsets.tofile(file)
+
+    def append(self, lines: list[bytes]):
+        new_offsets = array("Q")
+        position = self.size
+        for line in lines:
+            new_offsets.append(position)
+            position += len(line)
+
+        with open(self.log_path, "ab") as file:
+            file.write(b"".join(lines))
+            file.flush()
+            os.fsync(file.fileno())
+        with open(self.idx_path, "ab") as file:
+            new_offsets.tofile(file)
+
+        self.offsets.extend(new_offsets)
+        self.size = position
+        self.close()
+
+    def read(self, index: int) -> list:
+        if self._mm is None:
+            with open(self.log_path, "rb") as file:
+                self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        start = self.offsets[index]
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else self.size
+        return json.loads(self._mm[start:end])
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def remove(self):
+        self.close()
+        for path in (self.log_path, self.idx_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class SegmentedLog:
+    """append-only notification history split into segments
+
+    Every method does file I/O and must run in the executor.
+    """
+
+    def __init__(self, directory: str, segment_size: int):
+        self._directory = directory
+        self._segment_size = segment_size
+        self._lock = threading.Lock()
+        self._segments: list[_Segment] = []
+        self._bases: list[int] = []
+
+    @property
+    def first_id(self) -> int:
+        return self._segments[0].base_id if self._segments else 0
+
+    @property
+    def last_id(self) -> int:
+        return self._segments[-1].last_id if self._segments else 0
+
+    @property
+    def count(self) -> int:
+        return sum(segment.count for segment in self._segments)
+
+    @property
+    def size(self) -> int:
+        return sum(segment.size for segment in self._segments)
+
+    def open(self):
+        os.makedirs(self._directory, exist_ok=True)
+        bases = sorted(
+            int(name[:-4]) for name in os.listdir(self._directory)
+            if name.endswith(".log") and name[:-4].isdigit()
+        )
+        for base_id in bases:
+            segment = _Segment(self._directory, base_id)
+            segment.load()
+            if segment.count:
+                self._segments.append(segment)
+            else:
+                segment.remove()
+        self._bases = [segment.base_id for segment in self._segments]
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+
+    def append(self, records: list[list]):
+        """append records in id order, skipping ids already in the log"""
+        with self._lock:
+            pending = []
+            for record in records:
+                if record[0] <= self.last_id:
+                    continue
+                if self._segments and record[0] != self.last_id + 1 + len(pending):
+                    # id 不連續（例如清除後），開始新的分段
+                    self._flush(pending)
+                    pending = []
+                    self._new_segment(record[0])
+                pending.append(record)
+            self._flush(pending)
+
+    def _flush(self, records: list[list]):
+        """write records to the active segment, rolling over when it is full"""
+        segment = self._segments[-1] if self._segments else None
+        size = segment.size if segment else 0
+        batch = []
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+            if segment is None or size >= self._segment_size:
+                if batch:
+                    segment.append(batch)
+                    batch = []
+                segment = self._new_segment(record[0])
+                size = 0
+            batch.append(line)
+            size += len(line)
+        # 每個分段只寫入並 fsync 一次
+        if batch:
+            segment.append(batch)
+
+    def _new_segment(self, base_id: int) -> _Segment:
+        segment = _Segment(self._directory, base_id)
+        open(segment.log_path, "ab").close()
+        self._segments.append(segment)
+        self._bases.append(base_id)
+        return segment
+
+    def read_before(self, before: int | None, limit: int) -> list[list]:
+        """return up to limit records with id < before, newest first"""
+        with self._lock:
+            result = []
+            position = self.last_id if before is None else min(before - 1, self.last_id)
+            index = bisect_right(self._bases, position) - 1
+
+            while index >= 0 and len(result) < limit:
+                segment = self._segments[index]
+                if position > segment.last_id:
+                    position = segment.last_id
+                while position >= segment.base_id and len(result) < limit:
+                    result.append(segment.read(position - segment.base_id))
+                    position -= 1
+                index -= 1
+            return result
+
+    def apply_retention(self, max_count: int, cutoff: float | None, max_bytes: int) -> int:
+        """drop the oldest whole segments beyond the count, age and size limits,
+        a limit of 0 is unlimited"""
+        with self._lock:
+            dropped = 0
+            count = sum(segment.count for segment in self._segments)
+            size = sum(segment.size for segment in self._segments)
+            while len(self._segments) > 1:
+                oldest = self._segments[0]
+                if not (
+                    (max_count and count - oldest.count >= max_count)
+                    or (max_bytes and size > max_bytes)
+                    or (cutoff is not None and 0 < oldest.read(oldest.count - 1)[1] < cutoff)
+                ):
+                    break
+                self._segments.pop(0)
+                self._bases.pop(0)
+                count -= oldest.count
+                size -= oldest.size
+                dropped += oldest.count
+                oldest.remove()
+            return dropped
+
+    def clear(self):
+        with self._lock:
+            for segment in self._segments:
+                segment.remove()
+            self._segments.clear()
+            self._bases.clear()
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+
+from collections import OrderedDict
+
+from homeassistant.components.http import StaticPathConfig
+from homeassistant.helpers.storage import STORAGE_DIR
+
+from .const import (
+    DOMAIN, MEDIA_URL, MEDIA_CACHE_BUDGET, MEDIA_MAX_FILE, MEDIA_THUMB_SIZE, MEDIA_MEMO_SIZE,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+LOCAL_PREFIX = "/local/"
+THUMB_SUFFIX = "_thumb.jpg"
+THUMB_TYPES = {"png", "jpg", "jpeg", "webp"}
+
+
+def _is_local(source: str | None) -> bool:
+    return bool(source) and source.startswith(LOCAL_PREFIX)
+
+
+class MediaCache:
+    """content-addressed copies of local media with thumbnails
+
+    Files under /local/ are copied once per distinct content and served
+    from MEDIA_URL with long-lived cache headers, so every notification
+    keeps its own snapshot even when the source file is overwritten.
+    The least recently used copies are removed when the cache grows past
+    its budget, notifications then fall back to the original file.
+    """
+
+    def __init__(self, hass, budget: int = MEDIA_CACHE_BUDGET):
+        self.hass = hass
+        self.budget = budget
+        self._path = hass.config.path(STORAGE_DIR, DOMAIN, "media")
+        self._www = os.path.realpath(hass.config.path("www"))
+        # 檔名 -> 大小，依最近使用順序排列，淘汰時從最久未使用的開始
+        self._files: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+        # (來源, mtime, 大小) -> 快取網址，避免重複計算雜湊
+        self._memo: OrderedDict[tuple, str] = OrderedDict()
+        self.evictions = 0  # 淘汰次數，用於讓已渲染的 HTML 失效
+        # 來源 -> 處理中的工作，同一個檔案只處理一次，不同檔案可同時處理
+        self._pending: dict[tuple[str, bool], asyncio.Future] = {}
+
+    async def async_setup(self):
+        await self.hass.async_add_executor_job(self._scan)
+        await self.hass.http.async_register_static_paths(
+            [StaticPathConfig(MEDIA_URL, self._path, True)]
+        )
+        _LOGGER.debug("Media cache at %s holds %s files, %s bytes", self._path, len(self._files), self._size)
+
+    def _scan(self):
+        os.makedirs(self._path, exist_ok=True)
+        with os.scandir(self._path) as entries:
+            files = sorted(
+                (entry.stat().st_mtime, entry.name, entry.stat().st_size)
+                for entry in entries if entry.is_file()
+            )
+        for _, name, size in files:
+            self._files[name] = size
+            self._size += size
+        self._remove(self._evict())
+
+    def url(self, cached: str | None, source: str | None) -> str | None:
+        """return the cached copy while it is kept, otherwise the original source"""
+        if cached and cached.rsplit("/", 1)[-1] in self._files:
+            return cached
+        return source
+
+    def thumbnail(self, url: str | None) -> str | None:
+        """return the thumbnail url of a cached image, if one was made"""
+        if not url or not url.startswith(MEDIA_URL):
+            return None
+        name = url.rsplit("/", 1)[-1].rsplit(".", 1)[0] + THUMB_SUFFIX
+        return f"{MEDIA_URL}/{name}" if name in self._files else None
+
+    async def async_resolve(self, prepared) -> tuple[str | None, str | None]:
+        """return the cached image and video urls of a notification
+
+        The result is shared through prepared, so a broadcast is copied once
+        no matter how many persons receive it.
+        """
+        image, video = prepared.image, prepared.video
+        if not _is_local(image) and not _is_local(video):
+            return image, video
+        if (task := prepared._media.get("task")) is None:
+            task = prepared._media["task"] = self.hass.async_create_task(
+                self._async_resolve(image, video)
+            )
+        return await task
+
+    async def _async_resolve(self, image: str | None, video: str | None):
+        return await asyncio.gather(self.async_store(image, True), self.async_store(video, False))
+
+    async def async_store(self, source: str | None, thumbnail: bool) -> str | None:
+        """copy a /local/ file into the cache and return its url, or source unchanged"""
+        if not _is_local(source):
+            return source
+        key = (source, thumbnail)
+        if (pending := self._pending.get(key)) is None:
+            pending = self._pending[key] = self.hass.async_create_task(self._async_store(source, thumbnail))
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _async_store(self, source: str, thumbnail: bool) -> str:
+        try:
+            result = await self.hass.async_add_executor_job(self._store, source, thumbnail)
+        except Exception as e:
+            _LOGGER.warning("Failed to cache %s: %s", source, e)
+            return source
+        if result is None:
+            return source
+
+        url, added, memo = result
+        if memo is not None:
+            self._memo[memo] = url
+            if len(self._memo) > MEDIA_MEMO_SIZE:
+                self._memo.popitem(last=False)
+        for name, size in added:
+            # 內容相同的檔案可能同時被複製
+            if name not in self._files:
+                self._files[name] = size
+                self._size += size
+        self._touch(url)
+        if removed := self._evict():
+            await self.hass.async_add_executor_job(self._remove, removed)
+        return url
+
+    def _store(self, source: str, thumbnail: bool) -> tuple[str, list[tuple[str, int]], tuple | None] | None:
+        """runs in the executor, return the url, the files that were written
+        and the memo key to remember, bookkeeping is left to the event loop"""
+        relative = source[len(LOCAL_PREFIX):].split("?", 1)[0]
+        path = os.path.realpath(os.path.join(self._www, relative))
+        if not path.startswith(self._www + os.sep) or not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        if (url := self._memo.get(key)) is not None and url.rsplit("/", 1)[-1] in self._files:
+            return url, [], None
+        if stat.st_size > MEDIA_MAX_FILE:
+            return None
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                digest.update(chunk)
+        extension = os.path.splitext(path)[1].lower()
+        name = digest.hexdigest() + extension
+
+        added = []
+        target = os.path.join(self._path, name)
+        if name not in self._files:
+            shutil.copyfile(path, target)
+            added.append((name, stat.st_size))
+        if thumbnail and extension.lstrip(".") in THUMB_TYPES:
+            thumb = digest.hexdigest() + THUMB_SUFFIX
+            if thumb not in self._files and (size := self._make_thumbnail(target, thumb)):
+                added.append((thumb, size))
+
+        return f"{MEDIA_URL}/{name}", added, key
+
+    def _make_thumbnail(self, source: str, name: str) -> int | None:
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            # 沒有 Pillow 時直接使用原圖
+            return None
+
+        target = os.path.join(self._path, name)
+        try:
+            with Image.open(source) as image:
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((MEDIA_THUMB_SIZE, MEDIA_THUMB_SIZE))
+                image.convert("RGB").save(target, "JPEG", quality=80, optimize=True)
+            return os.path.getsize(target)
+        except Exception as e:
+            # 損毀或過大的圖片只保留原圖，副本仍需計入快取大小
+            _LOGGER.warning("Failed to make a thumbnail of %s: %s", source, e)
+            try:
+                os.remove(target)
+            except FileNotFoundError:
+                pass
+            return None
+
+    def _touch(self, url: str):
+        """mark a file and its thumbnail as recently used"""
+        name = url.rsplit("/", 1)[-1]
+        for used in (name, name.rsplit(".", 1)[0] + THUMB_SUFFIX):
+            if used in self._files:
+                self._files.move_to_end(used)
+
+    def _evict(self) -> list[str]:
+        """forget the least recently used files until the cache fits its budget,
+        return their names"""
+        removed = []
+        while self._size > self.budget and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self._size -= size
+            removed.append(name)
+        if removed:
+            self.evictions += 1
+        return removed
+
+    def _remove(self, names: list[str]):
+        for name in names:
+            try:
+                os.remove(os.path.join(self._path, name))
+            except FileNotFoundError:
+                pass
+            _LOGGER.debug("Evicted %s from the media cache", name)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import time
+
+from array import array
+from collections import deque
+
+from .const import METRICS_WINDOW, PRIORITIES
+
+
+class RateCounter:
+    """events per minute over a rolling window of one-second buckets"""
+
+    __slots__ = ("_counts", "_stamps")
+
+    def __init__(self):
+        self._counts = array("I", bytes(4 * 60))
+        self._stamps = array("q", bytes(8 * 60))
+
+    def add(self, count: int = 1):
+        second = int(time.monotonic())
+        index = second % 60
+        if self._stamps[index] != second:
+            self._stamps[index] = second
+            self._counts[index] = 0
+        self._counts[index] += count
+
+    @property
+    def per_minute(self) -> int:
+        second = int(time.monotonic())
+        return sum(
+            count for count, stamp in zip(self._counts, self._stamps)
+            if second - stamp < 60
+        )
+
+
+class LatencyWindow:
+    """most recent samples in seconds, percentiles are computed on read"""
+
+    __slots__ = ("_samples",)
+
+    def __init__(self, maxlen: int = METRICS_WINDOW):
+        self._samples = deque(maxlen=maxlen)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    @property
+    def mean(self) -> float | None:
+        if not self._samples:
+            return None
+        return sum(self._samples) / len(self._samples)
+
+
+class DeviceMetrics:
+    """delivery latency and outcome counts of one notify service"""
+
+    __slots__ = ("latency", "delivered", "failures")
+
+    def __init__(self):
+        self.latency = LatencyWindow()
+        self.delivered = 0
+        self.failures = 0
+
+
+class HelperMetrics:
+    """rolling performance counters of one NotificationHelper"""
+
+    def __init__(self, devices: list[str]):
+        self.commands = RateCounter()
+        self.latency = LatencyWindow()
+        self.priority_latency = {priority: LatencyWindow() for priority in PRIORITIES}
+        self.render = LatencyWindow()
+        self.persist = LatencyWindow()
+        self.devices = {device_id: DeviceMetrics() for device_id in devices}
+        self.suppressed = 0
+
+    def record_delivery(
+        self, device_id: str, ok: bool, latency: float,
+        started: float | None = None, priority: str | None = None,
+    ):
+        """record a finished delivery, started is the monotonic time of the service call"""
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices[device_id] = DeviceMetrics()
+
+        if ok:
+            device.delivered += 1
+            device.latency.add(latency)
+            if started is not None:
+                elapsed = time.monotonic() - started
+                self.latency.add(elapsed)
+                if priority in self.priority_latency:
+                    self.priority_latency[priority].add(elapsed)
+        else:
+            device.failures += 1
@@ -5,7 +5,10 @@ class NotificationCard extends HTMLElement {
     this.previousNotifications = [];
     this._handleImageClick = this._handleImageClick.bind(this);
     this._handleFullscreenClick = this._handleFullscreenClick.bind(this);
+    this._handleLoadMoreClick = this._handleLoadMoreClick.bind(this);
     this._eventSubscription = null;
+    this._next = null;
+    this._loadingMore = false;
     this._isFirstRender = true;
   }
 
@@ -21,6 +24,14 @@ class NotificationCard extends HTMLElement {
       ...config
     };
 
+    // 伺服器端篩選，只接收符合條件的通知
+    this._filter = {};
+    if (config.unread_only) this._filter.unread = true;
+    if (config.color) this._filter.color = String(config.color);
+    if (config.tag) this._filter.tag = String(config.tag);
+    this._storageKey = `savedNotifications_${config.person_name}` +
+      (Object.keys(this._filter).length ? `_${JSON.stringify(this._filter)}` : "");
+
     // 設置媒體尺寸
     if (config.media_width) {
       this.style.setProperty('--media-width',
@@ -47,7 +58,10 @@ class NotificationCard extends HTMLElement {
       return;
     }
 
-    this.previousNotifications = JSON.parse(localStorage.getItem(`savedNotifications_${this.config.person_name}`) || "[]")
+    // 舊版本保存的是 HTML 字串，略過等待快照
+    this.previousNotifications = JSON.parse(
+      localStorage.getItem(this._storageKey) || "[]"
+    ).filter(n => n && typeof n === 'object');
 
     // 首次渲染通知
     if (this._isFirstRender) {
@@ -61,30 +75,23 @@ class NotificationCard extends HTMLElement {
     const fullscreenContainer = this.shadowRoot.querySelector('.fullscreen-container');
 
     container.addEventListener('click', this._handleImageClick);
+    container.addEventListener('click', this._handleLoadMoreClick);
     fullscreenContainer.addEventListener('click', this._handleFullscreenClick);
   }
 
   // 訂閱通知更新事件
   _subscribeToEvents(hass) {
     try {
-      this.unsubscribe = hass.connection.subscribeMessage((event) => {
-
-        // console.log("收到事件:", event);
-        if (event.event_type === "update" &&
-          event.person.includes(this.config.person_name)) {
-
-          const newNotifications = event.notifications || [];
-          // 只有當通知變更時才重新渲染
-          if (this._notificationsChanged(newNotifications)) {
-            this._render(hass, newNotifications);
-            this.previousNotifications = [...newNotifications];
-            localStorage.setItem(
-              `savedNotifications_${this.config.person_name}`,
-              JSON.stringify(this.previousNotifications)
-            );
-          }
+      this._lastSeq = null;
+      this._resyncing = false;
+      this.unsubscribe = hass.connection.subscribeMessage(
+        (event) => this._handleEvent(hass, event),
+        {
+          type: "notifyhelper/subscribe",
+          persons: [`person.${this.config.person_name}`],
+          ...this._filter,
         }
-      }, { type: `notifyhelper/${this.config.person_name}` });
+      );
 
       this._eventSubscription = this.unsubscribe;
     } catch (error) {
@@ -93,20 +100,141 @@ class NotificationCard extends HTMLElement {
     }
   }
 
+  _handleEvent(hass, event) {
+    // console.log("收到事件:", event);
+    // 同一個訂閱可能包含多位人員的更新
+    if (event.event_type !== "update" ||
+      event.person !== this.config.person_name) return;
+
+    const changes = event.changes || [];
+    const snapshot = changes.find(c => c.op === "snapshot");
+    if (snapshot) {
+      this._resyncing = false;
+      this._lastSeq = event.seq;
+      this._next = snapshot.next ?? null;
+      this._commit(hass, snapshot.notifications || [], true);
+      return;
+    }
+
+    if (this._resyncing) return;
+    // 序號不連續時重新取得完整快照
+    if (this._lastSeq === null || event.seq !== this._lastSeq + 1) {
+      this._requestSnapshot(hass);
+      return;
+    }
+
+    this._lastSeq = event.seq;
+    this._commit(hass, this._applyChanges([...this.previousNotifications], changes));
+  }
+
+  _applyChanges(notifications, changes) {
+    for (const change of changes) {
+      switch (change.op) {
+        case "added":
+          notifications = [...(change.notifications || []), ...notifications];
+          break;
+        case "updated": {
+          const updated = new Map((change.notifications || []).map(n => [n.id, n]));
+          notifications = notifications.map(n => updated.get(n.id) || n);
+          break;
+        }
+        case "evicted":
+          notifications = notifications.filter(n => n.id >= change.before);
+          break;
+        case "read":
+          notifications = notifications.map(n => n.id > change.until ? n : ({
+            ...n, html: n.html.replace("alert-type='info'", "alert-type='success'")
+          }));
+          break;
+        case "cleared":
+          notifications = [];
+          this._next = null;
+          break;
+      }
+    }
+    return notifications;
+  }
+
+  async _requestSnapshot(hass) {
+    this._resyncing = true;
+    try {
+      const event = await hass.connection.sendMessagePromise({
+        type: "notifyhelper/snapshot",
+        person: `person.${this.config.person_name}`,
+        ...this._filter,
+        seq: this._lastSeq ?? -1,
+      });
+      if (event) this._handleEvent(hass, event);
+    } catch (error) {
+      console.error("Failed to resync notifications:", error);
+    } finally {
+      this._resyncing = false;
+    }
+  }
+
+  // 載入更舊的一頁歷史通知
+  async _loadMore(hass) {
+    if (this._loadingMore || this._next === null) return;
+    this._loadingMore = true;
+    try {
+      const page = await hass.connection.sendMessagePromise({
+        type: "notifyhelper/history",
+        person: `person.${this.config.person_name}`,
+        ...this._filter,
+        before: this._next,
+        limit: 50,
+      });
+      if (page) {
+        this._next = page.next ?? null;
+        const known = new Set(this.previousNotifications.map(n => n.id));
+        this._commit(hass, [
+          ...this.previousNotifications,
+          ...(page.notifications || []).filter(n => !known.has(n.id)),
+        ], true);
+      }
+    } catch (error) {
+      console.error("Failed to load more notifications:", error);
+    } finally {
+      this._loadingMore = false;
+    }
+  }
+
+  _commit(hass, newNotifications, force = false) {
+    // 只有當通知變更時才重新渲染
+    if (force || this._notificationsChanged(newNotifications)) {
+      this._render(hass, newNotifications);
+      this.previousNotifications = [...newNotifications];
+      localStorage.setItem(
+        this._storageKey,
+        JSON.stringify(this.previousNotifications)
+      );
+    }
+  }
+
   _notificationsChanged(newNotifications) {
     if (newNotifications.length !== this.previousNotifications.length) return true;
-    return newNotifications.some((n, i) => n !== this.previousNotifications[i]);
+    return newNotifications.some((n, i) => {
+      const prev = this.previousNotifications[i];
+      return n.id !== prev.id || n.html !== prev.html;
+    });
   }
 
   _handleImageClick(event) {
     if (event.target.tagName.toLowerCase() === 'img') {
       const fullscreenContainer = this.shadowRoot.querySelector('.fullscreen-container');
       const fullscreenImage = this.shadowRoot.querySelector('.fullscreen-image');
-      fullscreenImage.src = event.target.src;
+      // 縮圖另外記錄了原圖網址
+      fullscreenImage.src = event.target.dataset.full || event.target.src;
       fullscreenContainer.classList.add('active');
     }
   }
 
+  _handleLoadMoreClick(event) {
+    if (event.target.classList.contains('load-more')) {
+      this._loadMore(this._hass);
+    }
+  }
+
   _handleFullscreenClick(event) {
     if (event.target.classList.contains('fullscreen-container')) {
       event.target.classList.remove('active');
@@ -114,17 +242,22 @@ class NotificationCard extends HTMLElement {
   }
 
   _render(hass, notifications) {
-    notifications = notifications.length > 0 ? notifications : ["No notifications available."];
+    notifications = notifications.length > 0
+      ? notifications.map(n => n.html)
+      : ["No notifications available."];
     const theme = hass.themes?.darkMode ? "dark" : "light";
     const styles = this._getStyles(theme);
     const notificationsHTML = notifications.map(
       n => `<div class="bubble">${this._processContent(n)}</div>`
     ).join('');
+    const loadMoreHTML = this._next !== null
+      ? `<button class="load-more">Load more</button>`
+      : '';
 
     // 渲染到 shadow DOM
     this.shadowRoot.innerHTML = `
       <style>${styles}</style>
-      <div class="notifications-container">${notificationsHTML}</div>
+      <div class="notifications-container">${notificationsHTML}${loadMoreHTML}</div>
       <div class="fullscreen-container">
         <img class="fullscreen-image" src="" alt="Fullscreen Image">
       </div>
@@ -161,6 +294,16 @@ class NotificationCard extends HTMLElement {
         transition: transform 0.3s ease;
       }
       .bubble img:hover { transform: scale(1.05); }
+      .load-more {
+        display: block;
+        margin: 10px auto;
+        padding: 6px 16px;
+        border: none;
+        border-radius: 15px;
+        background-color: ${backgroundColor};
+        color: ${textColor};
+        cursor: pointer;
+      }
       .fullscreen-container {
         display: none;
         position: fixed;
@@ -248,7 +391,10 @@ class NotificationCard extends HTMLElement {
     // 移除事件監聽
     const container = this.shadowRoot.querySelector('.notifications-container');
     const fullscreenContainer = this.shadowRoot.querySelector('.fullscreen-container');
-    if (container) container.removeEventListener('click', this._handleImageClick);
+    if (container) {
+      container.removeEventListener('click', this._handleImageClick);
+      container.removeEventListener('click', this._handleLoadMoreClick);
+    }
     if (fullscreenContainer) fullscreenContainer.removeEventListener('click', this._handleFullscreenClick);
 
     // 移除事件訂閱
@@ -268,7 +414,7 @@ class NotificationCard extends HTMLElement {
 }
 
 console.info(
-  `%c  NOTIFICATIONS-CARD  \n%c   Version:  V2.6.5   `,
+  `%c  NOTIFICATIONS-CARD  \n%c   Version:  V2.7.0   `,
   'color: orchid; font-weight: bold; background: dimgray;',
   'color: orange; font-weight: bold; background: white;'
 );
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+
+from urllib.parse import urlparse
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+from homeassistant.helpers.storage import STORAGE_DIR
+from homeassistant.util.dt import as_local, utc_from_timestamp
+
+from .const import DOMAIN, DATA_PATH, TEMPLATE_FILE, TEMPLATE_CHECK_INTERVAL, MEDIA_URL
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _check_url(url):
+    valid_extensions = {"mp4", "avi", "mov", "png", "jpg", "jpeg", "gif", "webp"}
+    result = urlparse(url)
+    url_bool = result.scheme in ['http', 'https']
+    path = result.path
+    file_type = path.split('.')[-1].lower() \
+                if '.' in path and path.split('.')[-1].lower() in valid_extensions else None
+    return file_type, url_bool
+
+
+def render_template(
+    template, title, message, color, image, video, timestamp, read=False, count=1,
+    thumbnail=None,
+) -> str:
+    """render notification HTML"""
+    video_type, video_is_url = _check_url(video) if video else (None, False)
+    _, image_is_url = _check_url(image) if image else (None, False)
+    return template.render(
+        title=title,
+        message=message,
+        color=color,
+        image=image,
+        image_is_url=image_is_url,
+        image_is_cached=image.startswith(MEDIA_URL) if image else False,
+        thumbnail=thumbnail,
+        video=video,
+        video_is_url=video_is_url,
+        video_is_cached=video.startswith(MEDIA_URL) if video else False,
+        video_type=video_type,
+        read=read,
+        count=count,
+        timestamp=timestamp,
+        send_time=as_local(utc_from_timestamp(timestamp)).strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+
+class TemplateCache:
+    """process-wide compiled template shared by every entry"""
+
+    def __init__(self, hass):
+        self.hass = hass
+        self._path = os.path.join(hass.config.config_dir, DATA_PATH)
+        self._bytecode_dir = hass.config.path(STORAGE_DIR, DOMAIN, "template_cache")
+        self._env = None
+        self._template = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = asyncio.Lock()
+
+    async def async_get(self):
+        """return the compiled template, recompiling when the file changed"""
+        if self._template is not None and \
+           time.monotonic() - self._checked < TEMPLATE_CHECK_INTERVAL:
+            return self._template
+
+        async with self._lock:
+            # 其他人員可能已在等待鎖時完成檢查
+            if self._template is None or \
+               time.monotonic() - self._checked >= TEMPLATE_CHECK_INTERVAL:
+                self._template = await self.hass.async_add_executor_job(self._load)
+                self._checked = time.monotonic()
+        return self._template
+
+    def _load(self):
+        """stat the template file and compile it if its mtime changed"""
+        mtime = os.stat(os.path.join(self._path, TEMPLATE_FILE)).st_mtime
+        if self._template is not None and mtime == self._mtime:
+            return self._template
+
+        if self._env is None:
+            os.makedirs(self._bytecode_dir, exist_ok=True)
+            self._env = Environment(
+                loader=FileSystemLoader(self._path),
+                bytecode_cache=FileSystemBytecodeCache(self._bytecode_dir),
+                autoescape=True,
+                trim_blocks=True,
+                lstrip_blocks=True,
+                auto_reload=False,
+            )
+        elif self._env.cache is not None:
+            self._env.cache.clear()
+
+        template = self._env.get_template(TEMPLATE_FILE)
+        if self._mtime is not None:
+            _LOGGER.info("Reloaded %s after it was modified", TEMPLATE_FILE)
+        self._mtime = mtime
+        return template
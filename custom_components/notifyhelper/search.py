@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import re
+
+from bisect import bisect_left, insort
+from collections.abc import Iterable
+from heapq import merge
+from itertools import chain, groupby, islice, takewhile
+from math import inf
+from typing import NamedTuple
+
+# 中日文沒有空白分詞，每個字元各自成為一個詞
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN = re.compile(f"[{_CJK}]|[^\\W_{_CJK}]+")
+_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+DAY = 86400
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.casefold())
+
+
+class SearchIndex:
+    """incremental positional inverted index over title and message
+
+    Terms in a query must all match. A quoted phrase or a term that splits
+    into several tokens (such as a CJK word) must match as adjacent tokens,
+    a trailing * matches every token with that prefix.
+    """
+
+    def __init__(self):
+        self._postings: dict[str, dict[int, list[int]]] = {}
+        self._docs: dict[int, frozenset[str]] = {}
+        self._vocabulary: list[str] = []  # 排序後的詞彙，用於前綴查詢
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, notification_id: int, title: str, message: str):
+        tokens = tokenize(title)
+        # 標題與內文之間留一個位置，片語不會跨越兩者
+        tokens.append("")
+        tokens.extend(tokenize(message))
+
+        for position, token in enumerate(tokens):
+            if not token:
+                continue
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                insort(self._vocabulary, token)
+            postings.setdefault(notification_id, []).append(position)
+        self._docs[notification_id] = frozenset(filter(None, tokens))
+
+    def remove(self, notification_id: int):
+        for token in self._docs.pop(notification_id, ()):
+            postings = self._postings[token]
+            del postings[notification_id]
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def clear(self):
+        self._postings.clear()
+        self._docs.clear()
+        self._vocabulary.clear()
+
+    def _term(self, term: str, phrase: bool) -> tuple[list[dict], list[dict] | None] | None:
+        """return the postings any of which must hold a doc, and the postings
+        that must appear at adjacent positions; None when nothing can match"""
+        tokens = tokenize(term)
+        if not phrase and term.endswith("*") and len(tokens) == 1:
+            start = bisect_left(self._vocabulary, tokens[0])
+            alternatives = [
+                self._postings[token] for token in
+                takewhile(lambda token: token.startswith(tokens[0]), islice(self._vocabulary, start, None))
+            ]
+            return (alternatives, None) if alternatives else None
+
+        postings = [self._postings.get(token) for token in tokens]
+        if not all(postings):
+            return None
+        # 單一詞不需要比對位置
+        return [min(postings, key=len)], postings if len(postings) > 1 else None
+
+    @staticmethod
+    def _adjacent(postings: list[dict], doc: int) -> bool:
+        # 候選只來自最短的 posting，其他詞可能不在此文件中
+        if any(doc not in posting for posting in postings):
+            return False
+        following = [set(posting[doc]) for posting in postings[1:]]
+        return any(
+            all(start + offset in positions for offset, positions in enumerate(following, 1))
+            for start in postings[0][doc]
+        )
+
+    def search(self, query: str, before: int | None = None, limit: int = 50) -> list[int]:
+        """return up to limit matching ids below before, newest first
+
+        Candidates are walked newest first from the smallest posting list and
+        stop at limit, so phrase positions are only checked for the page
+        that is returned.
+        """
+        terms = []
+        for phrase, term in _QUERY.findall(query):
+            if not tokenize(phrase or term):
+                continue
+            if (matched := self._term(phrase or term, bool(phrase))) is None:
+                return []
+            terms.append(matched)
+        if not terms:
+            return []
+
+        # 從最少文件的條件開始，依 id 遞增加入的 posting 反向走訪即為由新到舊
+        driver = min(terms, key=lambda term: sum(map(len, term[0])))
+        alternatives, adjacent = driver
+        if len(alternatives) == 1:
+            candidates = reversed(alternatives[0])
+        else:
+            # 前綴查詢合併各詞的 posting 並去除重複
+            candidates = (doc for doc, _ in groupby(
+                merge(*(reversed(posting) for posting in alternatives), reverse=True)
+            ))
+        others = [term for term in terms if term is not driver]
+
+        result = []
+        for doc in candidates:
+            if before is not None and doc >= before:
+                continue
+            if (adjacent is None or self._adjacent(adjacent, doc)) and all(
+                any(doc in posting for posting in alternatives)
+                and (adjacent is None or self._adjacent(adjacent, doc))
+                for alternatives, adjacent in others
+            ):
+                result.append(doc)
+                if len(result) >= limit:
+                    break
+        return result
+
+
+class ViewFilter(NamedTuple):
+    """server-side filter of a notification view, None fields match anything"""
+    unread: bool | None = None
+    color: str | None = None
+    tag: str | None = None
+    start: float | None = None  # 包含
+    end: float | None = None  # 不包含
+
+    @property
+    def by_read_state(self) -> bool:
+        return self.unread is not None
+
+    def matches(self, notification, read_id: int) -> bool:
+        if self.unread is not None and (notification.id > read_id) != self.unread:
+            return False
+        if self.color and (notification.color or "").casefold() != self.color.casefold():
+            return False
+        if self.tag and (notification.tag or "").casefold() != self.tag.casefold():
+            return False
+        if self.start is not None and notification.timestamp < self.start:
+            return False
+        if self.end is not None and notification.timestamp >= self.end:
+            return False
+        return True
+
+
+class FilterIndex:
+    """secondary indexes by color, tag and day of the notification
+
+    Read state needs no index: unread notifications are exactly the ids
+    above the read watermark, at the front of the messages.
+    """
+
+    def __init__(self):
+        self._colors: dict[str, dict[int, None]] = {}
+        self._tags: dict[str, dict[int, None]] = {}
+        self._days: dict[int, dict[int, None]] = {}
+
+    def _keys(self, notification):
+        if notification.color:
+            yield self._colors, notification.color.casefold()
+        if notification.tag:
+            yield self._tags, notification.tag.casefold()
+        yield self._days, int(notification.timestamp // DAY)
+
+    def add(self, notification):
+        for index, key in self._keys(notification):
+            index.setdefault(key, {})[notification.id] = None
+
+    def remove(self, notification):
+        for index, key in self._keys(notification):
+            if (ids := index.get(key)) is not None:
+                ids.pop(notification.id, None)
+                if not ids:
+                    del index[key]
+
+    def clear(self):
+        self._colors.clear()
+        self._tags.clear()
+        self._days.clear()
+
+    def candidates(self, view: ViewFilter) -> tuple[int, Iterable[int]] | None:
+        """return the size and ids, newest first, of the most selective
+        indexed condition of view, None when view has no indexed condition"""
+        sources = []
+        for index, value in ((self._colors, view.color), (self._tags, view.tag)):
+            if value:
+                ids = index.get(value.casefold(), {})
+                sources.append((len(ids), reversed(ids)))
+
+        if view.start is not None or view.end is not None:
+            first = -inf if view.start is None else view.start // DAY
+            last = inf if view.end is None else view.end // DAY
+            days = sorted((day for day in self._days if first <= day <= last), reverse=True)
+            sources.append((
+                sum(len(self._days[day]) for day in days),
+                chain.from_iterable(reversed(self._days[day]) for day in days),
+            ))
+
+        return min(sources, key=lambda source: source[0]) if sources else None
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import logging
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import timedelta
+
+from homeassistant.components.sensor import (
+    SensorEntity, SensorEntityDescription, SensorStateClass,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .helper import NotificationHelper
+from .metrics import DeviceMetrics, LatencyWindow
+from .const import DOMAIN, HELPER
+
+_LOGGER = logging.getLogger(__name__)
+
+SCAN_INTERVAL = timedelta(seconds=30)
+
+
+def _ms(window: LatencyWindow, pct: float | None = None) -> float | None:
+    value = window.mean if pct is None else window.percentile(pct)
+    return None if value is None else round(value * 1000, 1)
+
+
+def _window_attrs(window: LatencyWindow) -> dict:
+    return {"p95": _ms(window, 95), "samples": len(window)}
+
+
+def _priority_attrs(helper: NotificationHelper, pct: float) -> dict:
+    return {
+        priority: _ms(window, pct)
+        for priority, window in helper.metrics.priority_latency.items()
+    }
+
+
+@dataclass(frozen=True, kw_only=True)
+class HelperSensorDescription(SensorEntityDescription):
+    value_fn: Callable[[NotificationHelper], float | int | None]
+    attrs_fn: Callable[[NotificationHelper], dict] | None = None
+
+
+SENSORS = (
+    HelperSensorDescription(
+        key="queue_depth",
+        translation_key="queue_depth",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda helper: helper.queue_depth,
+    ),
+    HelperSensorDescription(
+        key="commands_per_minute",
+        translation_key="commands_per_minute",
+        native_unit_of_measurement="commands/min",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda helper: helper.metrics.commands.per_minute,
+    ),
+    HelperSensorDescription(
+        key="dropped_commands",
+        translation_key="dropped_commands",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda helper: (
+            helper.queue.dropped + helper.queue.coalesced + helper.queue.rejected
+        ),
+        attrs_fn=lambda helper: {
+            "policy": helper.queue.policy,
+            "dropped": helper.queue.dropped,
+            "coalesced": helper.queue.coalesced,
+            "rejected": helper.queue.rejected,
+        },
+    ),
+    HelperSensorDescription(
+        key="suppressed_duplicates",
+        translation_key="suppressed_duplicates",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda helper: helper.metrics.suppressed,
+    ),
+    HelperSensorDescription(
+        key="latency_p50",
+        translation_key="latency_p50",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda helper: _ms(helper.metrics.latency, 50),
+        attrs_fn=lambda helper: _priority_attrs(helper, 50),
+    ),
+    HelperSensorDescription(
+        key="latency_p95",
+        translation_key="latency_p95",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda helper: _ms(helper.metrics.latency, 95),
+        attrs_fn=lambda helper: _priority_attrs(helper, 95),
+    ),
+    HelperSensorDescription(
+        key="render_time",
+        translation_key="render_time",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda helper: _ms(helper.metrics.render),
+        attrs_fn=lambda helper: _window_attrs(helper.metrics.render),
+    ),
+    HelperSensorDescription(
+        key="persist_time",
+        translation_key="persist_time",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda helper: _ms(helper.metrics.persist),
+        attrs_fn=lambda helper: _window_attrs(helper.metrics.persist),
+    ),
+)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+) -> None:
+    """Set up diagnostic sensors for a NotifyHelper entry."""
+    helper = hass.data[DOMAIN][entry.entry_id][HELPER]
+    entities = [HelperSensor(entry, helper, description) for description in SENSORS]
+    entities.extend(
+        DeviceLatencySensor(entry, helper, device_id)
+        for device_id in helper.metrics.devices
+    )
+    async_add_entities(entities)
+
+
+class _BaseHelperSensor(SensorEntity):
+    _attr_has_entity_name = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, entry: ConfigEntry, helper: NotificationHelper):
+        self._helper = helper
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, entry.entry_id)},
+            name=entry.title,
+            entry_type=DeviceEntryType.SERVICE,
+        )
+
+
+class HelperSensor(_BaseHelperSensor):
+    """rolling metric of a NotificationHelper"""
+
+    entity_description: HelperSensorDescription
+
+    def __init__(self, entry, helper, description: HelperSensorDescription):
+        super().__init__(entry, helper)
+        self.entity_description = description
+        self._attr_unique_id = f"{entry.entry_id}_{description.key}"
+
+    @property
+    def native_value(self):
+        return self.entity_description.value_fn(self._helper)
+
+    @property
+    def extra_state_attributes(self) -> dict | None:
+        if self.entity_description.attrs_fn is None:
+            return None
+        return self.entity_description.attrs_fn(self._helper)
+
+
+class DeviceLatencySensor(_BaseHelperSensor):
+    """delivery latency and failures of one notify service"""
+
+    _attr_translation_key = "device_latency"
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, entry, helper, device_id: str):
+        super().__init__(entry, helper)
+        self._device_id = device_id
+        self._attr_unique_id = f"{entry.entry_id}_{device_id}_latency"
+        self._attr_translation_placeholders = {"device": device_id}
+
+    @property
+    def _device(self) -> DeviceMetrics:
+        return self._helper.metrics.devices[self._device_id]
+
+    @property
+    def native_value(self) -> float | None:
+        return _ms(self._device.latency, 50)
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        return {
+            "p95": _ms(self._device.latency, 95),
+            "delivered": self._device.delivered,
+            "failures": self._device.failures,
+        }
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+
+from contextlib import contextmanager
+
+from homeassistant.const import EVENT_HOMEASSISTANT_FINAL_WRITE
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store, STORAGE_DIR
+
+from .data import Notification, Retention
+from .history_log import SegmentedLog
+from .const import DOMAIN, STORAGE_VERSION, SAVE_DELAY, JOURNAL_MAX_ENTRIES, SEGMENT_SIZE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _SnapshotStore(Store):
+    """snapshot file, migrating the rendered HTML list of version 1"""
+
+    async def _async_migrate_func(self, old_major_version, old_minor_version, old_data):
+        if old_major_version == 1:
+            # 最新的在前面，沒有保存原始內容，只能保留 HTML
+            total = len(old_data["msg"])
+            old_data = {
+                "msg": [
+                    Notification(total - i, 0, "", "", html=html).to_list()
+                    for i, html in enumerate(old_data["msg"])
+                ],
+                "badge": old_data["badge"],
+                "next_id": total + 1,
+                "read_id": 0,
+            }
+        return old_data
+
+
+class NotificationStore:
+    """write-behind persistence: journal appends with debounced snapshots"""
+
+    def __init__(self, hass, entry_id, history_log: bool = False, retention: Retention = Retention()):
+        self.hass = hass
+        self._retention = retention
+        self._store = _SnapshotStore(hass, STORAGE_VERSION, f"{DOMAIN}/{entry_id}.json")
+        self._journal_path = hass.config.path(STORAGE_DIR, DOMAIN, f"{entry_id}.journal")
+        self._log_path = hass.config.path(STORAGE_DIR, DOMAIN, entry_id)
+        self._log = SegmentedLog(self._log_path, SEGMENT_SIZE) if history_log else None
+        self._lock = asyncio.Lock()
+        self._seq = 0
+        self._journal_len = 0
+        self._data_func = None
+        self._unsub_timer = None
+        self._unsub_final_write = None
+        # 批次處理中資料已改變但尚未寫入 journal，此時不能建立快照
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def has_log(self) -> bool:
+        return self._log is not None
+
+    async def async_load(self) -> tuple[dict | None, list[list]]:
+        """load the snapshot and the journal entries written after it"""
+        snapshot = await self._store.async_load()
+        saved_seq = snapshot.get("journal_seq", 0) if snapshot else 0
+        lines = await self.hass.async_add_executor_job(self._load_files)
+
+        entries = [line[1:] for line in lines if line[0] > saved_seq]
+        self._seq = max([saved_seq, *(line[0] for line in lines)])
+        self._journal_len = len(lines)
+        if entries:
+            _LOGGER.debug("Replaying %s journal entries from %s", len(entries), self._journal_path)
+        return snapshot, entries
+
+    async def async_append(self, entries: list[list], data_func) -> tuple[int, int]:
+        """append entries to the journal and schedule a snapshot
+
+        Returns the number of records the history log dropped by retention and
+        the oldest id it still holds.
+        """
+        if not entries:
+            return 0, 0
+
+        self._data_func = data_func
+        async with self._lock:
+            lines = []
+            for entry in entries:
+                self._seq += 1
+                lines.append([self._seq, *entry])
+            dropped = await self.hass.async_add_executor_job(self._write, entries, lines)
+            self._journal_len += len(lines)
+
+        if self._journal_len >= JOURNAL_MAX_ENTRIES:
+            await self._async_write_snapshot()
+        else:
+            self._async_schedule_snapshot()
+        return dropped
+
+    @contextmanager
+    def batch(self):
+        """hold timed snapshots back until the batch has appended its journal"""
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._idle.set()
+
+    async def async_apply_retention(self) -> tuple[int, int]:
+        """expire old records from the history log"""
+        if self._log is None:
+            return 0, 0
+        async with self._lock:
+            return await self.hass.async_add_executor_job(self._apply_retention)
+
+    async def async_compact(self, data_func):
+        """write a snapshot now and truncate the journal"""
+        self._data_func = data_func
+        await self._async_write_snapshot()
+
+    async def async_flush(self):
+        """write any pending snapshot, used on close and shutdown"""
+        self._async_cancel_listeners()
+        if self._journal_len:
+            await self._async_write_snapshot()
+
+    async def async_read_before(self, before: int | None, limit: int) -> list[list]:
+        """read older records from the history log"""
+        if self._log is None:
+            return []
+        return await self.hass.async_add_executor_job(self._log.read_before, before, limit)
+
+    async def async_seed_log(self, records: list[list]):
+        """write existing records into an empty history log"""
+        if self._log is not None and records:
+            await self.hass.async_add_executor_job(self._log.append, records)
+
+    async def async_close(self):
+        """flush and release the history log"""
+        await self.async_flush()
+        if self._log is not None:
+            await self.hass.async_add_executor_job(self._log.close)
+
+    async def async_remove(self):
+        """remove snapshot, journal and history log"""
+        self._async_cancel_listeners()
+        await self._store.async_remove()
+        await self.hass.async_add_executor_job(self._remove_files)
+
+    @callback
+    def _async_schedule_snapshot(self):
+        if self._unsub_timer is None:
+            self._unsub_timer = async_call_later(self.hass, SAVE_DELAY, self._async_timer_fired)
+        if self._unsub_final_write is None:
+            self._unsub_final_write = self.hass.bus.async_listen_once(
+                EVENT_HOMEASSISTANT_FINAL_WRITE, self._async_final_write
+            )
+
+    @callback
+    def _async_cancel_listeners(self):
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+        if self._unsub_final_write is not None:
+            self._unsub_final_write()
+            self._unsub_final_write = None
+
+    async def _async_timer_fired(self, _now):
+        self._unsub_timer = None
+        await self._async_write_snapshot(between_batches=True)
+
+    async def _async_final_write(self, _event):
+        self._unsub_final_write = None
+        await self._async_write_snapshot(between_batches=True)
+
+    async def _async_write_snapshot(self, between_batches: bool = False):
+        """save full snapshot and drop the journal entries it covers
+
+        Timed snapshots wait for the running batch, otherwise they would
+        capture records whose journal entries get a later sequence number
+        and are replayed a second time after a crash.
+        """
+        if self._data_func is None:
+            return
+
+        self._async_cancel_listeners()
+        if between_batches:
+            while not self._idle.is_set():
+                await self._idle.wait()
+        try:
+            async with self._lock:
+                if between_batches and not self._idle.is_set():
+                    # 等待鎖時開始了新的批次，留給下一次
+                    self._async_schedule_snapshot()
+                    return
+                seq = self._seq
+                await self._store.async_save({**self._data_func(), "journal_seq": seq})
+                # 快照寫入後才截斷，中途崩潰時以 journal_seq 避免重複套用
+                await self.hass.async_add_executor_job(self._truncate_journal)
+                self._journal_len = 0
+        except Exception as e:
+            _LOGGER.error("Failed to write snapshot %s: %s", self._store.key, e)
+
+    def _load_files(self) -> list[list]:
+        if self._log is not None:
+            self._log.open()
+        return self._read_journal()
+
+    def _write(self, entries: list[list], lines: list[list]) -> tuple[int, int]:
+        # 先寫入歷史紀錄，重新啟動時以其為準
+        dropped = 0, 0
+        if self._log is not None:
+            records = []
+            for entry in entries:
+                if entry[0] == "add":
+                    records.append(entry[1])
+                elif entry[0] == "clear":
+                    self._log.append(records)
+                    records = []
+                    self._log.clear()
+            self._log.append(records)
+            dropped = self._apply_retention()
+        self._write_journal(lines)
+        return dropped
+
+    def _apply_retention(self) -> tuple[int, int]:
+        max_count, max_age, max_bytes = self._retention
+        cutoff = time.time() - max_age if max_age else None
+        dropped = self._log.apply_retention(max_count, cutoff, max_bytes)
+        return dropped, self._log.first_id
+
+    def _read_journal(self) -> list[list]:
+        if not os.path.exists(self._journal_path):
+            return []
+
+        lines = []
+        with open(self._journal_path, encoding="utf-8") as file:
+            for raw in file:
+                try:
+                    lines.append(json.loads(raw))
+                except ValueError:
+                    # 寫入途中斷電留下的殘缺行
+                    _LOGGER.warning("Skipping damaged journal line in %s", self._journal_path)
+        return lines
+
+    def _write_journal(self, lines: list[list]):
+        os.makedirs(os.path.dirname(self._journal_path), exist_ok=True)
+        with open(self._journal_path, "a", encoding="utf-8") as file:
+            file.writelines(
+                json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n"
+                for line in lines
+            )
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _truncate_journal(self):
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path, "w", encoding="utf-8"):
+                pass
+
+    def _remove_files(self):
+        if os.path.exists(self._journal_path):
+            os.remove(self._journal_path)
+        if self._log is not None:
+            self._log.clear()
+        if os.path.isdir(self._log_path):
+            shutil.rmtree(self._log_path)
@@ -1,21 +1,195 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 
 import voluptuous as vol
 
 from homeassistant.components import websocket_api
 from homeassistant.components.websocket_api import async_register_command
+from homeassistant.components.websocket_api.messages import IDEN_JSON_TEMPLATE, IDEN_TEMPLATE
 from homeassistant.core import callback
 from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.json import json_bytes
 
-from .const import DOMAIN, UPDATE_EVENT
+from .search import ViewFilter
+from .const import DOMAIN, UPDATE_EVENT, HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE, PERSONS
 
 _LOGGER = logging.getLogger(__name__)
 
+PERSON_ID = vol.Match(r"^person\.\w+$")
+SEARCH_SCHEMA = {
+    vol.Required("query"): vol.All(str, vol.Length(min=1, max=200)),
+    vol.Optional("before"): vol.Coerce(int),
+    vol.Optional("limit", default=HISTORY_PAGE_SIZE):
+        vol.All(vol.Coerce(int), vol.Range(min=1, max=HISTORY_MAX_PAGE)),
+}
+# 時間範圍為 Unix 時間戳記，start 包含、end 不包含
+FILTER_SCHEMA = {
+    vol.Optional(key): schema for key, schema in (
+        ("unread", bool),
+        ("color", str),
+        ("tag", str),
+        ("start", vol.Coerce(float)),
+        ("end", vol.Coerce(float)),
+    )
+}
+_IDEN = IDEN_JSON_TEMPLATE.encode()
+
+
+class SharedEvent:
+    """update event encoded once and shared by every subscriber
+
+    The message is serialized on first use with a placeholder id, each
+    subscriber only swaps in its own subscription id.
+    """
+
+    __slots__ = ("data", "_encoded")
+
+    def __init__(self, data: dict):
+        self.data = data
+        self._encoded: bytes | None = None
+
+    def message(self, msg_id: int) -> bytes:
+        if self._encoded is None:
+            self._encoded = json_bytes(websocket_api.event_message(IDEN_TEMPLATE, self.data))
+        # id 是第一個欄位，只需替換第一次出現的位置
+        return self._encoded.replace(_IDEN, str(msg_id).encode(), 1)
+
+
+def _signal(person: str) -> str:
+    return f"{UPDATE_EVENT}_{person.split('.')[1]}"
+
+
+def _view(msg: dict) -> ViewFilter | None:
+    """build the view filter of msg, None when it has no filter"""
+    view = ViewFilter(**{key: msg[key] for key in ViewFilter._fields if key in msg})
+    return view if any(value is not None for value in view) else None
+
+
+def _get_helper(hass, connection, msg):
+    """look up the helper of msg["person"], replying with an error when there is none"""
+    helper = hass.data[DOMAIN][PERSONS].get(msg["person"])
+    if helper is None:
+        connection.send_error(msg["id"], websocket_api.ERR_NOT_FOUND, f"No entry for {msg['person']}")
+    return helper
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): f"{DOMAIN}/subscribe",
+    vol.Optional("persons"): [PERSON_ID],
+    **FILTER_SCHEMA,
+})
+@websocket_api.ws_require_user()
+@websocket_api.async_response
+@callback
+async def handle_subscribe(hass, connection, msg):
+    """Subscribe to the updates of several persons in one merged stream"""
+
+    _LOGGER.debug("WS multi subscription: %s", msg)
+    helpers = hass.data[DOMAIN][PERSONS]
+    # 未指定時訂閱目前所有人員
+    persons = list(dict.fromkeys(msg.get("persons") or helpers))
+    view = _view(msg)
+
+    @callback
+    def handle_notifications_update(event: SharedEvent):
+        helper = helpers.get(f"person.{event.data['person']}")
+        if view is None or helper is None:
+            connection.send_message(event.message(msg["id"]))
+            return
+        # 篩選後的內容因訂閱而異，無法共用編碼結果
+        changes = helper.filter_changes(event.data["changes"], view)
+        connection.send_message(websocket_api.event_message(msg["id"], {**event.data, "changes": changes}))
+
+    unsubscribes = [
+        async_dispatcher_connect(hass, _signal(person), handle_notifications_update)
+        for person in persons
+    ]
+
+    @callback
+    def unsubscribe():
+        for unsub in unsubscribes:
+            unsub()
+
+    connection.subscriptions[msg["id"]] = unsubscribe
+    connection.send_result(msg["id"])
+
+    snapshots = await asyncio.gather(*[
+        helpers[person].async_snapshot(view) for person in persons if person in helpers
+    ])
+    for snapshot in snapshots:
+        if snapshot:
+            handle_notifications_update(SharedEvent(snapshot))
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): f"{DOMAIN}/snapshot",
+    vol.Required("person"): PERSON_ID,
+    vol.Optional("seq"): int,
+    **FILTER_SCHEMA,
+})
+@websocket_api.ws_require_user()
+@websocket_api.async_response
+@callback
+async def handle_person_snapshot(hass, connection, msg):
+    """Handle a client of the merged stream reporting a sequence gap"""
+
+    if (helper := _get_helper(hass, connection, msg)) is not None:
+        connection.send_result(msg["id"], await helper.async_snapshot(_view(msg)))
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): f"{DOMAIN}/history",
+    vol.Required("person"): PERSON_ID,
+    vol.Optional("before"): vol.Coerce(int),
+    vol.Optional("limit", default=HISTORY_PAGE_SIZE):
+        vol.All(vol.Coerce(int), vol.Range(min=1, max=HISTORY_MAX_PAGE)),
+    **FILTER_SCHEMA,
+})
+@websocket_api.ws_require_user()
+@websocket_api.async_response
+@callback
+async def handle_person_history(hass, connection, msg):
+    """Handle a request for one page of older notifications of a person"""
+
+    if (helper := _get_helper(hass, connection, msg)) is not None:
+        connection.send_result(
+            msg["id"], await helper.async_history(msg.get("before"), msg["limit"], _view(msg))
+        )
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): f"{DOMAIN}/search",
+    vol.Required("person"): PERSON_ID,
+    **SEARCH_SCHEMA,
+})
+@websocket_api.ws_require_user()
+@websocket_api.async_response
+@callback
+async def handle_person_search(hass, connection, msg):
+    """Handle a full-text search over the history of a person"""
+
+    if (helper := _get_helper(hass, connection, msg)) is not None:
+        connection.send_result(
+            msg["id"], await helper.async_search(msg["query"], msg.get("before"), msg["limit"])
+        )
+
+
+def register_ws_commands(hass):
+    """register the commands shared by every entry"""
+    async_register_command(hass, handle_subscribe)
+    async_register_command(hass, handle_person_snapshot)
+    async_register_command(hass, handle_person_history)
+    async_register_command(hass, handle_person_search)
+
 
 async def register_ws(hass, helper, name):
-    """register websocket"""
+    """register the legacy per-person subscription
+
+    Snapshots, history and search are served by the shared commands of
+    register_ws_commands.
+    """
     
     @websocket_api.websocket_command({vol.Required("type"): f"{DOMAIN}/{name}"})
     @websocket_api.ws_require_user()
@@ -27,20 +201,18 @@ async def register_ws(hass, helper, name):
         _LOGGER.debug("WS subscription successful: %s", msg) 
 
         @callback
-        def handle_notifications_update(data: dict):
-            connection.send_message({
-                "id": msg["id"],
-                "type": "event",
-                "event": data,
-            })
-            _LOGGER.debug("WS sent message: %s", data)
+        def handle_notifications_update(event: SharedEvent):
+            connection.send_message(event.message(msg["id"]))
+            _LOGGER.debug("WS sent seq %s to %s", event.data["seq"], msg["id"])
 
         unsubscribe = async_dispatcher_connect(hass, f"{UPDATE_EVENT}_{name}", handle_notifications_update)
         connection.subscriptions[msg["id"]] = unsubscribe
         connection.send_result(msg["id"])
-        await helper.async_trigger()
+        # 快照只送給新的連線，其他訂閱者不受影響
+        if snapshot := await helper.async_snapshot():
+            handle_notifications_update(SharedEvent(snapshot))
 
     async_register_command(
         hass,
         handle_subscribe_updates
-    )
\ No newline at end of file
+    )